@@ -0,0 +1,407 @@
+import math
+from decimal import Decimal
+import numpy as np
+from GBM import GBMSimulator
+from MarketMaker import BookSnapshot, make_strategy
+from OrderFlow import OrderFlow, resolve_passive_sides, _NO_LEVEL
+from SimulationRecorder import STEP_DTYPE
+
+_NO_ASK = -_NO_LEVEL  # sentinel best ask for an empty side, far above any real level
+_NO_LIMIT = np.iinfo(np.int64).max // 2  # resolve_passive_sides limit when the opposite side is empty
+
+
+class BatchSimulator:
+    def __init__(self, n_books, initial_price=100.0, mu=0.05, sigma=0.15, num_steps=50, spread=0.10, size=25,
+                 seed=None, strategy="fixed_spread", strategy_params=None, tick_size=0.01, band=0.03,
+                 order_flow=None, margin=64):
+        """
+        Steps n_books independent copies of the run_simulation market in
+        lockstep, so every phase of a step (stale cancels, investor flow,
+        quoting, market orders) is a handful of array operations across all
+        books instead of a Python loop per book.
+
+        Parameters:
+        - n_books: number of independent books (K)
+        - initial_price, mu, sigma, num_steps, spread, size, strategy, strategy_params: as build_simulation
+        - seed: seeds the GBM paths and the book / flow stream of the whole batch
+        - tick_size: minimum price increment of every book
+        - band: resting levels further than this fraction from the price are cancelled each step
+        - order_flow: OrderFlow supplying the investor flow parameters (the standard ones by default)
+        - margin: how far outside the band orders may still be placed within a step (further is dropped)
+        """
+        self.n_books = n_books
+        self.tick_size = tick_size
+        self.band = band
+        self.size = size
+        self.margin = margin
+        self._price_decimals = max(0, -Decimal(str(tick_size)).as_tuple().exponent)
+        self._rows = np.arange(n_books)
+
+        gbm_seed, book_seed = np.random.SeedSequence(seed).spawn(2)
+        self.rng = np.random.default_rng(book_seed)
+        # One GBMSimulator drives every path: S is a (K, 1) column of current prices
+        self.gbm = GBMSimulator(S0=np.full((n_books, 1), float(initial_price)), mu=mu, sigma=sigma,
+                                dt=1.0/num_steps, rng=np.random.default_rng(gbm_seed))
+        if order_flow is None:
+            order_flow = OrderFlow(self.rng)
+        self.order_flow = order_flow
+        if isinstance(strategy, str):
+            strategy = make_strategy(strategy, spread=spread, **(strategy_params or {}))
+        self.strategy = strategy
+
+        # Each book is a dense ladder of investor size per tick, one row of a
+        # (K, width) array used as a ring buffer: tick t lives in column
+        # t % width. Only ticks in [low, high] can hold size: the cancel band,
+        # widened during a step by orders placed just outside it (e.g. asks
+        # undercutting an empty bid side). width always exceeds the band plus
+        # margin, so the ring never wraps onto live levels and nothing needs
+        # shifting as prices move.
+        self.band_low, self.band_high = self._live_range(np.full(n_books, float(initial_price)))
+        self.low, self.high = self.band_low.copy(), self.band_high.copy()
+        self.width = 0
+        self.bids = np.zeros((n_books, 0), dtype=np.int64)
+        self.asks = np.zeros((n_books, 0), dtype=np.int64)
+        self._ensure_width(initial_price)
+
+        # Seed every book the way OrderBook does: 5 levels a side, one tick apart
+        initial_tick = int(round(initial_price / tick_size))
+        levels = np.arange(1, 6)
+        self.bids[:, (initial_tick - levels) % self.width] = self.rng.integers(5, 20, (n_books, 5))
+        self.asks[:, (initial_tick + levels) % self.width] = self.rng.integers(5, 20, (n_books, 5))
+        self.best_bid = np.full(n_books, initial_tick - 1, dtype=np.int64)  # investor best, tracked incrementally
+        self.best_ask = np.full(n_books, initial_tick + 1, dtype=np.int64)
+
+        # Market maker state, one entry per book. Quotes are kept out of the
+        # ladders: the maker always posts last, so it sits at the back of its level.
+        self.bid_tick = np.zeros(n_books, dtype=np.int64)  # current quotes, 0 = not quoting
+        self.ask_tick = np.zeros(n_books, dtype=np.int64)
+        self.bid_left = np.zeros(n_books, dtype=np.int64)  # unfilled size of the resting quote
+        self.ask_left = np.zeros(n_books, dtype=np.int64)
+        self.inventory = np.zeros(n_books, dtype=np.int64)
+        self.cash = np.zeros(n_books)
+        self.avg_cost = np.zeros(n_books)  # average entry price of the open position, 0 when flat
+        self.realized_pnl = np.zeros(n_books)
+        self.mark_price = np.full(n_books, float(initial_price))  # mid of the last mark
+        self.spread_pnl = np.zeros(n_books)  # PnL attribution, as in MarketMaker
+        self.inventory_pnl = np.zeros(n_books)
+        self.recent_fills = np.zeros(n_books, dtype=np.int64)
+        self.mid_price = np.full(n_books, float(initial_price))
+        self.steps_done = 0
+
+    def _band_ticks(self):
+        """ (ticks, in_band) covering each book's occupied range from low, padded to the widest range. """
+        count = self.high - self.low + 1
+        offsets = np.arange(int(count.max()))
+        return self.low[:, None] + offsets, offsets < count[:, None]
+
+    def _ensure_width(self, max_price):
+        """ Grows the ring buffers (to a power of two) if the cancel band at max_price could wrap. """
+        needed = 2 * (math.ceil(self.band * max_price / self.tick_size) + self.margin + 2)
+        if needed <= self.width:
+            return
+        width = 1 << (needed - 1).bit_length()
+        ticks, in_band = self._band_ticks()
+        rows = np.broadcast_to(self._rows[:, None], ticks.shape)[in_band]
+        ticks = ticks[in_band]
+        for name in ("bids", "asks"):
+            resized = np.zeros((self.n_books, width), dtype=np.int64)
+            if self.width:
+                resized[rows, ticks % width] = getattr(self, name)[rows, ticks % self.width]
+            setattr(self, name, resized)
+        self.width = width
+
+    def _live_range(self, prices):
+        """
+        First and last tick per book within band of the price, using the same
+        rounded-price test as the stale cancel in run_simulation.
+        """
+        offsets = np.arange(-1, 2)
+        bounds = []
+        for edge in (1 - self.band, 1 + self.band):
+            candidates = np.rint(prices * edge / self.tick_size).astype(np.int64)[:, None] + offsets
+            live = np.abs(self.ticks_to_price(candidates) - prices[:, None]) / prices[:, None] <= self.band
+            # lowest live candidate at the bottom edge, highest at the top edge
+            pick = live.argmax(axis=1) if edge < 1 else 2 - live[:, ::-1].argmax(axis=1)
+            bounds.append(candidates[self._rows, pick])
+        return bounds
+
+    def ticks_to_price(self, ticks):
+        """ Converts tick counts back to prices on the tick grid. """
+        return np.round(ticks * self.tick_size, self._price_decimals)
+
+    def _clear(self, first, last):
+        """ Zeroes ticks first..last (inclusive, possibly empty) of every book on both sides. """
+        count = np.clip(last - first + 1, 0, self.width)
+        n = int(count.max())
+        if not n:
+            return
+        ticks = first[:, None] + np.arange(n)
+        keep = np.arange(n) < count[:, None]
+        rows, columns = np.broadcast_to(self._rows[:, None], ticks.shape)[keep], ticks[keep] % self.width
+        self.bids[rows, columns] = 0
+        self.asks[rows, columns] = 0
+
+    def _scan(self, ladder, rows, from_top):
+        """ Best tick of the given books found by scanning their band (highest if from_top, else lowest). """
+        low, high = self.low[rows], self.high[rows]
+        count = high - low + 1
+        offsets = np.arange(int(count.max()))
+        ticks = high[:, None] - offsets if from_top else low[:, None] + offsets
+        resting = (ladder[rows[:, None], ticks % self.width] > 0) & (offsets < count[:, None])
+        best = ticks[np.arange(len(rows)), resting.argmax(axis=1)]
+        return np.where(resting.any(axis=1), best, _NO_LEVEL if from_top else _NO_ASK)
+
+    def _cancel_stale(self, prices):
+        """
+        Cancels every level (maker quotes included) more than band away from
+        the price. Only the ticks that left the band since the last step need
+        clearing, and the best prices are rescanned only for books that lost them.
+        """
+        low, high = self._live_range(prices)
+        self._clear(self.low, np.minimum(low - 1, self.high))
+        self._clear(np.maximum(high + 1, self.low), self.high)
+        self.band_low, self.band_high = low, high
+        self.low, self.high = low.copy(), high.copy()
+
+        for tick, left in ((self.bid_tick, self.bid_left), (self.ask_tick, self.ask_left)):
+            left[(tick < low) | (tick > high)] = 0
+
+        # A best bid below the band means every bid went; one above it leaves the next level unknown
+        self.best_bid[self.best_bid < low] = _NO_LEVEL
+        self.best_ask[self.best_ask > high] = _NO_ASK
+        for ladder, best, lost, from_top in ((self.bids, self.best_bid, self.best_bid > high, True),
+                                             (self.asks, self.best_ask, self.best_ask < low, False)):
+            rows = np.flatnonzero(lost)
+            if len(rows):
+                best[rows] = self._scan(ladder, rows, from_top)
+
+    def _placeable(self, ticks):
+        """ Mask of ticks (one row per book) close enough to the band to be stored. """
+        return (ticks >= (self.band_low - self.margin)[:, None]) & (ticks <= (self.band_high + self.margin)[:, None])
+
+    def _occupy(self, ticks, mask):
+        """ Widens [low, high] to cover the masked ticks (one row per book). """
+        self.low = np.minimum(self.low, np.where(mask, ticks, _NO_ASK).min(axis=1))
+        self.high = np.maximum(self.high, np.where(mask, ticks, _NO_LEVEL).max(axis=1))
+
+    def _add(self, ladder, ticks, sizes, accepted):
+        """ Adds the accepted orders that can be stored; returns the mask of orders added. """
+        keep = accepted & self._placeable(ticks)
+        rows = np.broadcast_to(self._rows[:, None], ticks.shape)
+        np.add.at(ladder, (rows[keep], ticks[keep] % self.width), sizes[keep])
+        self._occupy(ticks, keep)
+        return keep
+
+    def _touch(self):
+        """ Best bid / ask per book including the maker's resting quotes. """
+        return (np.maximum(self.best_bid, np.where(self.bid_left > 0, self.bid_tick, _NO_LEVEL)),
+                np.minimum(self.best_ask, np.where(self.ask_left > 0, self.ask_tick, _NO_ASK)))
+
+    def _submit_flow(self, prices):
+        """ OrderFlow.submit for every book: bids first, then asks in the negated tick space. """
+        flow = self.order_flow
+        ticks, sizes, aggressive, valid = flow.draw_batch(prices, self.tick_size, "buy")
+        touch_bid, touch_ask = self._touch()
+        ticks, accepted = resolve_passive_sides(ticks, aggressive, valid, touch_bid,
+                                                np.where(touch_ask == _NO_ASK, _NO_LIMIT, touch_ask))
+        added = self._add(self.bids, ticks, sizes, accepted)
+        self.best_bid = np.maximum(self.best_bid, np.where(added, ticks, _NO_LEVEL).max(axis=1))
+
+        ticks, sizes, aggressive, valid = flow.draw_batch(prices, self.tick_size, "sell")
+        touch_bid, touch_ask = self._touch()
+        ticks, accepted = resolve_passive_sides(-ticks, aggressive, valid,
+                                                np.where(touch_ask == _NO_ASK, _NO_LEVEL, -touch_ask),
+                                                np.where(touch_bid == _NO_LEVEL, _NO_LIMIT, -touch_bid))
+        added = self._add(self.asks, -ticks, sizes, accepted)
+        self.best_ask = np.minimum(self.best_ask, np.where(added, -ticks, _NO_ASK).min(axis=1))
+
+    def _place_quotes(self):
+        """
+        MarketMaker.place_quotes for every book, calling the strategy once with
+        array snapshots of the investor book (the maker pulls its quotes first).
+        """
+        best_bid, best_ask = self.best_bid, self.best_ask
+        quotable = (best_bid != _NO_LEVEL) & (best_ask != _NO_ASK)
+        bid_depth = np.where(quotable, self.bids[self._rows, best_bid % self.width], 0)
+        ask_depth = np.where(quotable, self.asks[self._rows, best_ask % self.width], 0)
+        snapshot = BookSnapshot(best_bid, best_ask, bid_depth, ask_depth, (best_bid + best_ask) / 2,
+                                self.tick_size, self.inventory, self.recent_fills)
+        bid, ask = self.strategy(snapshot, self.size)
+
+        bid = np.broadcast_to(np.nan if bid is None else np.asarray(bid, dtype=float), best_bid.shape)
+        ask = np.broadcast_to(np.nan if ask is None else np.asarray(ask, dtype=float), best_ask.shape)
+        has_bid = quotable & ~np.isnan(bid)
+        has_ask = quotable & ~np.isnan(ask)
+        # Post-only, as in place_quotes. Quotes too far outside the band are not posted.
+        bid = np.minimum(np.nan_to_num(bid).astype(np.int64), best_ask - 1)
+        ask = np.maximum(np.nan_to_num(ask).astype(np.int64), best_bid + 1)
+        crossed = has_bid & has_ask & (bid >= ask)
+        has_bid &= ~crossed & self._placeable(bid[:, None])[:, 0]
+        has_ask &= ~crossed & self._placeable(ask[:, None])[:, 0]
+        self._occupy(np.stack([bid, ask], axis=1), np.stack([has_bid, has_ask], axis=1))
+        self.bid_tick = np.where(has_bid, bid, 0)
+        self.ask_tick = np.where(has_ask, ask, 0)
+        self.bid_left = np.where(has_bid, self.size, 0)
+        self.ask_left = np.where(has_ask, self.size, 0)
+
+    def _sweep(self, ladder, quantity, best, quote_tick, quote_left, from_top, rows=None, span=64):
+        """
+        Fills `quantity` per book against one side, best level first, with the
+        maker's quote at the back of its level. Updates the ladder, the best
+        price and quote_left in place and returns the size filled against the maker.
+
+        Only the `span` ticks from each book's touch (stretched to reach the
+        maker's quote) are gathered; books that might need more are redone
+        over their whole band.
+        """
+        fills = np.zeros(self.n_books, dtype=np.int64)
+        rows = self._rows if rows is None else rows
+        direction = -1 if from_top else 1
+        no_best = _NO_LEVEL if from_top else _NO_ASK
+        edge = (self.low if from_top else self.high)[rows]
+        touch, quote, left = best[rows], quote_tick[rows], quote_left[rows]
+        quoting = left > 0
+        active = (touch != no_best) | quoting
+        rows, edge, touch, quote, left, quoting = (a[active] for a in (rows, edge, touch, quote, left, quoting))
+        if not len(rows):
+            return fills
+
+        # Sweep from the touch (the better of best and quote) towards the band edge
+        start = np.where(touch == no_best, quote, touch)
+        start = np.where(quoting & ((quote - start) * direction < 0), quote, start)
+        reach = (edge - start) * direction + 1
+        behind = np.where(quoting, (quote - start) * direction + 1, 0)
+        n = min(max(span, int(behind.max())), int(reach.max()))
+
+        ticks = start[:, None] + direction * np.arange(n)
+        in_band = np.arange(n) < reach[:, None]
+        columns = ticks % self.width
+        window = np.where(in_band, ladder[rows[:, None], columns], 0)
+        index = np.arange(len(rows))
+        offset = np.clip((quote - start) * direction, 0, n - 1)
+        maker = np.where(quoting, left, 0)
+        total = window.copy()
+        total[index, offset] += maker
+
+        short = (quantity[rows] > total.sum(axis=1)) & (n < reach)
+        ahead = np.cumsum(total, axis=1) - total
+        consumed = np.minimum(np.maximum(quantity[rows, None] - ahead, 0), total)
+        maker_fill = np.minimum(np.maximum(consumed[index, offset] - window[index, offset], 0), maker)
+        remaining = window - consumed
+        remaining[index, offset] += maker_fill  # what was taken beyond the investors' size came from the maker
+
+        # Books that ran short are left untouched here and redone below over their whole band
+        done = ~short
+        write = in_band & done[:, None]
+        ladder[np.broadcast_to(rows[:, None], ticks.shape)[write], columns[write]] = remaining[write]
+        quote_left[rows[done]] -= maker_fill[done]
+        fills[rows[done]] = maker_fill[done]
+
+        # New best: the first level still resting in the window, or a rescan past it
+        resting = remaining > 0
+        found = resting.any(axis=1)
+        best[rows[done]] = np.where(found, ticks[index, resting.argmax(axis=1)], no_best)[done]
+        rescan = rows[done & ~found & (n < reach)]
+        if len(rescan):
+            best[rescan] = self._scan(ladder, rescan, from_top)
+        if short.any():
+            fills += self._sweep(ladder, quantity, best, quote_tick, quote_left, from_top, rows[short],
+                                 span=int(reach[short].max()))
+        return fills
+
+    def _market_orders(self):
+        """ 1-5 market orders per book, netted into one sweep per side. Returns the maker's fills. """
+        rng = self.rng
+        count = rng.integers(1, 6, self.n_books)
+        sizes = rng.integers(5, 15, (self.n_books, 5)) * (np.arange(5) < count[:, None])
+        buys = rng.random((self.n_books, 5)) < 0.5
+        # Buys only consume asks and sells only bids, so each side's orders can be
+        # swept as one: FIFO consumption per level is the same in aggregate.
+        mid = self._mark_to(self._mark())  # fills are marked against the mid they traded at
+        sold = self._sweep(self.asks, (sizes * buys).sum(axis=1), self.best_ask, self.ask_tick, self.ask_left,
+                           from_top=False)
+        bought = self._sweep(self.bids, (sizes * ~buys).sum(axis=1), self.best_bid, self.bid_tick, self.bid_left,
+                             from_top=True)
+
+        self._book_fills(-sold, self.ticks_to_price(self.ask_tick), mid)
+        self._book_fills(bought, self.ticks_to_price(self.bid_tick), mid)
+        self.recent_fills = bought - sold
+        return bought + sold
+
+    def _book_fills(self, signed, price, mid):
+        """ MarketMaker.update_pnl for one signed fill per book (positive = bought), 0 where nothing filled. """
+        position = self.inventory
+        size, held = np.abs(signed), np.abs(position)
+        closing = position * signed < 0
+        self.realized_pnl += np.where(closing, np.minimum(size, held), 0) * (price - self.avg_cost) * np.sign(position)
+        self.avg_cost = np.where(closing, np.where(size > held, price, np.where(size == held, 0.0, self.avg_cost)),
+                                 np.where(size > 0, (self.avg_cost * held + price * size) / np.maximum(held + size, 1),
+                                          self.avg_cost))
+        self.inventory = position + signed
+        self.cash -= signed * price
+        self.spread_pnl += signed * (mid - price)
+
+    def _mark_to(self, mid):
+        """ MarketMaker.mark: the mid's move since the last mark on the inventory held. Returns mid. """
+        self.inventory_pnl += self.inventory * (mid - self.mark_price)
+        self.mark_price = mid
+        return mid
+
+    def _mark(self):
+        """ OrderBook.get_current_market_price per book: mid, else the one-sided best, else the last value. """
+        best_bid, best_ask = self._touch()
+        has_bid, has_ask = best_bid != _NO_LEVEL, best_ask != _NO_ASK
+        mid = np.where(has_bid & has_ask, (best_bid + best_ask) * self.tick_size / 2,
+                       np.where(has_bid, self.ticks_to_price(best_bid),
+                                np.where(has_ask, self.ticks_to_price(best_ask), self.mid_price)))
+        self.mid_price = mid
+        return mid
+
+    def run(self, num_steps, chunk_size=1024):
+        """
+        Runs num_steps steps for every book and returns the per-step history
+        as a dict of (n_books, num_steps) arrays, one per SimulationRecorder
+        column.
+        """
+        k = self.n_books
+        history = {name: np.empty((k, num_steps), dtype=STEP_DTYPE[name]) for name in STEP_DTYPE.names}
+        history["step"][:] = np.arange(self.steps_done, self.steps_done + num_steps)
+
+        done = 0
+        while done < num_steps:
+            # 1️⃣ GBM prices for the whole batch, pre-generated a chunk at a time
+            chunk = self.gbm.simulate(min(chunk_size, num_steps - done), n_paths=k)
+            self.gbm.S = chunk[:, -1:]
+            self._ensure_width(chunk.max())
+            for prices in chunk.T:
+                # 2️⃣ Cancel outdated limit orders
+                self._cancel_stale(prices)
+                # 3. Investor limit orders
+                self._submit_flow(prices)
+                # 4️⃣ Market maker quotes
+                self._place_quotes()
+                # 5️⃣ Market orders
+                fills = self._market_orders()
+
+                # 6️⃣ Track PnL
+                unrealized = self.inventory * (self._mark_to(self._mark()) - self.avg_cost)
+                history["price"][:, done] = prices
+                history["inventory"][:, done] = self.inventory
+                history["realized_pnl"][:, done] = self.realized_pnl
+                history["unrealized_pnl"][:, done] = unrealized
+                history["total_pnl"][:, done] = unrealized + self.realized_pnl
+                history["spread_pnl"][:, done] = self.spread_pnl
+                history["inventory_pnl"][:, done] = self.inventory_pnl
+                history["bid"][:, done] = np.where(self.bid_tick > 0, self.ticks_to_price(self.bid_tick), np.nan)
+                history["ask"][:, done] = np.where(self.ask_tick > 0, self.ticks_to_price(self.ask_tick), np.nan)
+                history["fills"][:, done] = fills
+                done += 1
+
+        self.steps_done += num_steps
+        return history
+
+
+def batch_runs(history):
+    """ Splits a BatchSimulator.run history into per-book run dicts for ensemble.path_stats. """
+    return [{"seed": k, "prices": history["price"][k], "pnl": history["total_pnl"][k],
+             "inventory": history["inventory"][k]} for k in range(len(history["price"]))]
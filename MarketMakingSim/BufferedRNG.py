@@ -0,0 +1,75 @@
+import numpy as np
+
+
+class BufferedRNG:
+    def __init__(self, seed=None, block_size=8192):
+        """
+        A numpy Generator that pre-draws uniforms and standard normals in
+        vectorized blocks and hands them out as scalars or arrays, so the
+        simulation loop never pays per-call Generator overhead.
+
+        Parameters:
+        - seed: int, SeedSequence, Generator or None (fresh entropy)
+        - block_size: number of values drawn per refill
+
+        Output depends only on the seed and the sequence of calls made, so runs
+        are bit-reproducible.
+        """
+        if isinstance(seed, np.random.Generator):
+            self.generator = seed
+        else:
+            self.generator = np.random.default_rng(seed)
+        self.block_size = block_size
+        self._uniforms = np.empty(0)
+        self._u = 0
+        self._normals = np.empty(0)
+        self._n = 0
+
+    def __getstate__(self):
+        # Only the values not yet handed out are pickled, not the whole blocks
+        state = self.__dict__.copy()
+        state["_uniforms"], state["_u"] = self._uniforms[self._u:].copy(), 0
+        state["_normals"], state["_n"] = self._normals[self._n:].copy(), 0
+        return state
+
+    @classmethod
+    def spawn(cls, seed, n, block_size=8192):
+        """ n independent streams spawned from one SeedSequence. """
+        return [cls(child, block_size) for child in np.random.SeedSequence(seed).spawn(n)]
+
+    def _take_uniforms(self, n):
+        if self._u + n > len(self._uniforms):
+            leftover = self._uniforms[self._u:]
+            fresh = self.generator.random(max(self.block_size, n))
+            self._uniforms = np.concatenate([leftover, fresh])
+            self._u = 0
+        out = self._uniforms[self._u:self._u + n]
+        self._u += n
+        return out
+
+    def _take_normals(self, n):
+        if self._n + n > len(self._normals):
+            leftover = self._normals[self._n:]
+            fresh = self.generator.standard_normal(max(self.block_size, n))
+            self._normals = np.concatenate([leftover, fresh])
+            self._n = 0
+        out = self._normals[self._n:self._n + n]
+        self._n += n
+        return out
+
+    def random(self, size=None):
+        """ Uniform draws on [0, 1); a float when size is None, else an array. """
+        if size is None:
+            return float(self._take_uniforms(1)[0])
+        return self._take_uniforms(size)
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        if size is None:
+            return loc + scale * float(self._take_normals(1)[0])
+        return loc + scale * self._take_normals(size)
+
+    def integers(self, low, high, size=None):
+        """ Integers on [low, high), derived from the buffered uniforms. """
+        if size is None:
+            return low + int(self._take_uniforms(1)[0] * (high - low))
+        return low + (self._take_uniforms(size) * (high - low)).astype(np.int64)
@@ -0,0 +1,173 @@
+import json
+import numpy as np
+
+# Event types
+ADD, CANCEL, AMEND, TRADE, MARKET, QUOTE = range(6)
+EVENT_NAMES = ("add", "cancel", "amend", "trade", "market", "quote")
+
+# Verbosity levels: QUIET records nothing, TRADES records market orders,
+# fills and market maker quotes, ALL also records every add/cancel/amend.
+QUIET, TRADES, ALL = range(3)
+_EVENT_LEVEL = {ADD: ALL, CANCEL: ALL, AMEND: ALL, TRADE: TRADES, MARKET: TRADES, QUOTE: TRADES}
+
+EVENT_DTYPE = np.dtype([
+    ("seq", np.int64),       # journal-wide sequence number
+    ("step", np.int64),      # simulation step the event happened in
+    ("event", np.int8),      # one of ADD, CANCEL, ...
+    ("side", np.int8),       # +1 buy, -1 sell
+    ("order_id", np.int64),  # resting order ID, -1 for market orders
+    ("tick", np.int64),      # price level in book ticks
+    ("size", np.int64),
+    ("owner", np.int16),     # index into EventJournal.owners
+])
+
+
+class EventJournal:
+    def __init__(self, sinks=(), verbosity=ALL, batch_size=4096):
+        """
+        Collects order book events and hands them to sinks in batches.
+
+        Parameters:
+        - sinks: objects with write(events, owners) and close() methods
+        - verbosity: QUIET, TRADES or ALL
+        - batch_size: number of events staged before the sinks see them
+        """
+        self.sinks = list(sinks)
+        self.verbosity = verbosity
+        self.batch_size = batch_size
+        self.step = 0
+        self.owners = []  # owner code -> owner name
+        self._owner_codes = {}
+        self._pending = []
+        self._seq = 0
+
+    def owner_code(self, owner):
+        code = self._owner_codes.get(owner)
+        if code is None:
+            code = self._owner_codes[owner] = len(self.owners)
+            self.owners.append(owner)
+        return code
+
+    def record(self, event, side, order_id, tick, size, owner):
+        """ Stages one event; cheap enough to call from the book's hot path. """
+        if _EVENT_LEVEL[event] > self.verbosity:
+            return
+        self._pending.append((self._seq, self.step, event, 1 if side == "buy" else -1,
+                              order_id, tick, size, self.owner_code(owner)))
+        self._seq += 1
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Converts the staged events to a structured array and passes it to every sink. """
+        if not self._pending:
+            return
+        events = np.array(self._pending, dtype=EVENT_DTYPE)
+        self._pending = []
+        for sink in self.sinks:
+            sink.write(events, self.owners)
+
+    def close(self):
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
+
+
+class RingBufferSink:
+    def __init__(self, capacity=1_000_000):
+        """ Keeps the most recent `capacity` events in a preallocated array. """
+        self.buffer = np.zeros(capacity, dtype=EVENT_DTYPE)
+        self.capacity = capacity
+        self.count = 0  # total events written; the buffer holds the last min(count, capacity)
+        self.owners = []
+
+    def write(self, events, owners):
+        self.owners = owners
+        n = len(events)
+        events = events[-self.capacity:]  # older events in an oversized batch would be overwritten anyway
+        start = (self.count + n - len(events)) % self.capacity
+        first = min(len(events), self.capacity - start)
+        self.buffer[start:start + first] = events[:first]
+        self.buffer[:len(events) - first] = events[first:]
+        self.count += n
+
+    def close(self):
+        pass
+
+    def to_array(self):
+        """ Buffered events in chronological order. """
+        if self.count <= self.capacity:
+            return self.buffer[:self.count].copy()
+        start = self.count % self.capacity
+        return np.concatenate([self.buffer[start:], self.buffer[:start]])
+
+
+class BinaryFileSink:
+    def __init__(self, path, append=False):
+        """
+        Writes raw EVENT_DTYPE records to `path`, replacing any tape already
+        there; the owner table is written to `path + ".owners.json"` on close.
+        Read back with read_journal().
+
+        With append=True the events go after the existing tape instead, and
+        their owner codes are remapped onto its owner table, so read_journal()
+        sees one consistent table (seq restarts at 0 with each run).
+        """
+        self.path = path
+        self.owners = []
+        self._remap = None  # journal owner code -> tape owner code, when appending
+        if append:
+            try:
+                with open(path + ".owners.json") as f:
+                    self.owners = json.load(f)
+            except FileNotFoundError:
+                pass
+            self._remap = []
+        self._file = open(path, "ab" if append else "wb")
+
+    def write(self, events, owners):
+        if self._remap is None:
+            self.owners = owners
+        else:
+            for owner in owners[len(self._remap):]:
+                if owner not in self.owners:
+                    self.owners.append(owner)
+                self._remap.append(self.owners.index(owner))
+            events = events.copy()
+            events["owner"] = np.asarray(self._remap, dtype=events["owner"].dtype)[events["owner"]]
+        events.tofile(self._file)
+
+    def close(self):
+        self._file.close()
+        with open(self.path + ".owners.json", "w") as f:
+            json.dump(list(self.owners), f)
+
+
+class PrintSink:
+    """ Human-readable event log, for debugging small runs. """
+
+    def write(self, events, owners):
+        for e in events:
+            side = "buy" if e["side"] > 0 else "sell"
+            print(f"[{e['step']}] {EVENT_NAMES[e['event']]:<6} {side:<4} id={e['order_id']} "
+                  f"tick={e['tick']} size={e['size']} owner={owners[e['owner']]}")
+
+    def close(self):
+        pass
+
+
+def read_journal(path, mmap=True):
+    """
+    Loads a journal written by BinaryFileSink. Returns (events, owners); the
+    events are memory-mapped by default so large tapes are not read into RAM.
+    """
+    if mmap:
+        events = np.memmap(path, dtype=EVENT_DTYPE, mode="r")
+    else:
+        events = np.fromfile(path, dtype=EVENT_DTYPE)
+    try:
+        with open(path + ".owners.json") as f:
+            owners = json.load(f)
+    except FileNotFoundError:
+        owners = []
+    return events, owners
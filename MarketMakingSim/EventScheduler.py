@@ -0,0 +1,220 @@
+import heapq
+import math
+import time
+from MarketMaker import as_makers, place_quotes_in_turn
+from OrderFlow import OrderFlow
+
+# Event kinds, in the order their handlers are listed in EventDrivenSimulation
+PRICE, LIMIT, MARKET, QUOTE, CANCEL, RECORD = range(6)
+EVENT_NAMES = ("price", "limit", "market", "quote", "cancel", "record")
+
+
+def _exponential(rng, mean):
+    """ One exponential draw with the given mean, from a uniform of rng. """
+    return -math.log(1.0 - rng.random()) * mean
+
+
+class EventQueue:
+    def __init__(self):
+        """
+        Min-heap of pending events ordered by time. Events scheduled for the
+        same time come out in the order they were pushed.
+        """
+        self._heap = []
+        self._seq = 0
+
+    def push(self, time, kind, payload=None):
+        heapq.heappush(self._heap, (time, self._seq, kind, payload))
+        self._seq += 1
+
+    def pop(self):
+        """ Removes the next event and returns it as (time, kind, payload). """
+        time, _, kind, payload = heapq.heappop(self._heap)
+        return time, kind, payload
+
+    def peek_time(self):
+        """ Time of the next event, or inf if the queue is empty. """
+        return self._heap[0][0] if self._heap else math.inf
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class PoissonProcess:
+    def __init__(self, rate):
+        """
+        Homogeneous Poisson arrivals.
+
+        Parameters:
+        - rate: expected arrivals per unit time
+        """
+        self.rate = rate
+
+    def next_arrival(self, t, rng):
+        """ Time of the first arrival after t. """
+        return t + _exponential(rng, 1.0 / self.rate)
+
+
+class HawkesProcess:
+    def __init__(self, base_rate, alpha, beta):
+        """
+        Self-exciting arrivals with an exponential kernel: the intensity is
+        base_rate + sum(alpha * exp(-beta * (t - t_i))) over past arrivals t_i,
+        so every arrival makes more arrivals likely for a while (bursts).
+
+        Parameters:
+        - base_rate: background arrivals per unit time
+        - alpha: jump in intensity after each arrival
+        - beta: decay rate of that jump; alpha < beta keeps the process stationary,
+          with mean rate base_rate / (1 - alpha / beta)
+        """
+        self.base_rate = base_rate
+        self.alpha = alpha
+        self.beta = beta
+        self.excitation = 0.0  # Intensity above base_rate at self._t
+        self._t = 0.0
+
+    def intensity(self, t):
+        """ Intensity at time t >= the last arrival. """
+        return self.base_rate + self.excitation * math.exp(-self.beta * (t - self._t))
+
+    def next_arrival(self, t, rng):
+        """
+        Time of the first arrival after t, by Ogata thinning. Between arrivals
+        the intensity only decays, so its value at t bounds it until the next one.
+        """
+        while True:
+            bound = self.intensity(t)
+            self.excitation = bound - self.base_rate
+            self._t = t
+            t += _exponential(rng, 1.0 / bound)
+            if rng.random() * bound <= self.intensity(t):
+                self.excitation = self.intensity(t) - self.base_rate + self.alpha
+                self._t = t
+                return t
+
+
+class EventDrivenSimulation:
+    def __init__(self, gbm, order_book, market_maker, limit_process=None, market_process=None,
+                 price_process=None, quote_process=None, order_lifetime=None, record_interval=None,
+                 order_flow=None):
+        """
+        Continuous-time counterpart of run_simulation: GBM updates, investor
+        limit orders, market orders and maker requotes each arrive from their
+        own point process, and each investor limit order is cancelled after an
+        exponential lifetime unless it fills first. Work is only done when an
+        event fires, so quiet stretches are free and bursts cost what they contain.
+
+        Time is in the GBM's units; by default rates match the step loop, with
+        one gbm.dt per step.
+
+        Parameters:
+        - gbm, order_book, market_maker: as returned by build_simulation; market_maker may be a list
+          of competing makers, which requote in a rotating order and each record every row
+        - limit_process: investor limit orders, either side (Poisson, 30 per step)
+        - market_process: investor market orders (Hawkes, 3 per step on average, bursty)
+        - price_process: GBM updates (Poisson, 1 per step); the GBM advances by the elapsed time
+        - quote_process: maker requotes (Poisson, 1 per step)
+        - order_lifetime: mean lifetime of an investor limit order (20 steps)
+        - record_interval: time between recorder rows (1 step)
+        - order_flow: OrderFlow drawing investor limit orders, on the book's RNG by default
+        """
+        step = gbm.dt
+        self.gbm = gbm
+        self.order_book = order_book
+        self.market_maker = market_maker
+        self.makers = as_makers(market_maker)
+        self.rng = order_book.rng  # the investor flow shares the book's stream
+        self.order_flow = order_flow if order_flow is not None else OrderFlow(self.rng)
+        self.processes = {
+            PRICE: price_process or PoissonProcess(1.0 / step),
+            LIMIT: limit_process or PoissonProcess(30.0 / step),
+            MARKET: market_process or HawkesProcess(1.5 / step, alpha=5.0 / step, beta=10.0 / step),
+            QUOTE: quote_process or PoissonProcess(1.0 / step),
+        }
+        self.order_lifetime = order_lifetime if order_lifetime is not None else 20.0 * step
+        self.record_interval = record_interval if record_interval is not None else step
+
+        self.time = 0.0
+        self.price_time = 0.0  # Time of the last GBM update
+        self.step = len(self.makers[0].recorder)
+        self.counts = [0] * len(EVENT_NAMES)
+        if order_book.journal is not None:
+            order_book.journal.step = self.step
+        self.queue = EventQueue()
+        for kind, process in self.processes.items():
+            self.queue.push(process.next_arrival(self.time, self.rng), kind)
+        self.queue.push(self.record_interval, RECORD)
+        self._handlers = (self._on_price, self._on_limit, self._on_market, self._on_quote,
+                          self._on_cancel, self._on_record)
+
+    def _on_price(self, payload):
+        self.gbm.step(self.time - self.price_time)
+        self.price_time = self.time
+
+    def _on_limit(self, payload):
+        side = "buy" if self.rng.random() < 0.5 else "sell"
+        order_id = self.order_flow.submit_order(self.order_book, self.gbm.S, side)
+        if order_id is not None:
+            self.queue.push(self.time + _exponential(self.rng, self.order_lifetime), CANCEL, order_id)
+
+    def _on_market(self, payload):
+        rng = self.rng
+        side = "buy" if rng.random() < 0.5 else "sell"
+        self.order_book.execute_market_order(rng.integers(5, 15), side)
+
+    def _on_quote(self, payload):
+        place_quotes_in_turn(self.makers, self.counts[QUOTE])
+
+    def _on_cancel(self, order_id):
+        self.order_book.cancel_by_id(order_id)  # no-op if it already filled
+
+    def _on_record(self, payload):
+        for maker in self.makers:
+            maker.record_step(self.step, self.gbm.S)
+        self.step += 1
+        if self.order_book.journal is not None:
+            self.order_book.journal.step = self.step
+
+    def run(self, duration):
+        """
+        Processes every event up to self.time + duration. Can be called again
+        to continue the same run. Returns a dict with the number of events
+        processed, the wall time, events_per_sec and a per-kind count.
+        """
+        queue, processes, handlers, counts, rng = self.queue, self.processes, self._handlers, self.counts, self.rng
+        end = self.time + duration
+        before = list(counts)
+        start = time.perf_counter()
+
+        while queue.peek_time() <= end:
+            self.time, kind, payload = queue.pop()
+            handlers[kind](payload)
+            counts[kind] += 1
+            # Point processes reschedule themselves; cancels are one-off
+            if kind in processes:
+                queue.push(processes[kind].next_arrival(self.time, rng), kind)
+            elif kind == RECORD:
+                queue.push(self.time + self.record_interval, RECORD)
+        self.time = end
+
+        seconds = time.perf_counter() - start
+        journal = self.order_book.journal
+        if journal is not None:
+            journal.flush()
+        by_kind = {name: counts[i] - before[i] for i, name in enumerate(EVENT_NAMES)}
+        events = sum(by_kind.values())
+        return {"events": events, "seconds": seconds, "events_per_sec": events / seconds if seconds else math.inf,
+                "counts": by_kind}
+
+
+if __name__ == "__main__":
+    from simulation_generator import build_simulation
+
+    num_steps = 1000
+    gbm, order_book, market_maker = build_simulation(num_steps=num_steps, seed=1)
+    sim = EventDrivenSimulation(gbm, order_book, market_maker)
+    stats = sim.run(1.0)
+    print(f"{stats['events']:,} events in {stats['seconds']:.2f}s ({stats['events_per_sec']:,.0f} events/sec)")
+    print(stats["counts"])
+    print(f"Final PnL {market_maker.total_pnl:.2f}, inventory {market_maker.inventory}")
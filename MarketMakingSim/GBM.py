@@ -1,33 +1,73 @@
 import numpy as np
 
 class GBMSimulator:
-    def __init__(self, S0, mu, sigma, dt=1.0):
+    def __init__(self, S0, mu, sigma, dt=1.0, rng=None, keep_history=True):
         """
         Initialize the GBM model.
-        
+
         Parameters:
         - S0: Initial price
         - mu: Drift (expected return)
         - sigma: Volatility
         - dt: Time step size (e.g., 1.0 for one time unit)
+        - rng: numpy Generator owned by this simulator (fresh entropy if None)
+        - keep_history: keep every price in self.history; turn off for long runs whose
+          prices are recorded elsewhere, so memory stays constant (history is then None)
         """
         self.S = S0
         self.mu = mu
         self.sigma = sigma
         self.dt = dt
-        self.history = [S0]
+        self.history = [S0] if keep_history else None
+        self.rng = rng if rng is not None else np.random.default_rng()
 
-    def step(self):
+    def step(self, dt=None):
         """
-        Simulate one time step of GBM.
+        Simulate one time step of GBM, of length dt (self.dt by default).
         """
-        Z = np.random.normal()
-        drift = (self.mu - 0.5 * self.sigma ** 2) * self.dt
-        diffusion = self.sigma * np.sqrt(self.dt) * Z
+        dt = self.dt if dt is None else dt
+        Z = self.rng.standard_normal()
+        drift = (self.mu - 0.5 * self.sigma ** 2) * dt
+        diffusion = self.sigma * np.sqrt(dt) * Z
         self.S = self.S * np.exp(drift + diffusion)
-        self.history.append(self.S)
+        if self.history is not None:
+            self.history.append(self.S)
         return self.S
 
+    def simulate(self, n_steps, n_paths=1):
+        """
+        Generate whole GBM paths in one vectorized call, starting from the
+        current price. Does not advance the simulator.
+
+        Returns an array of shape (n_paths, n_steps) holding the price after
+        each step (the starting price is not included).
+        """
+        Z = self.rng.standard_normal((n_paths, n_steps))
+        drift = (self.mu - 0.5 * self.sigma ** 2) * self.dt
+        log_returns = drift + self.sigma * np.sqrt(self.dt) * Z
+        return self.S * np.exp(np.cumsum(log_returns, axis=1))
+
+    def iter_chunks(self, n_steps, chunk_size=1024):
+        """
+        Hand out the next n_steps prices of this path as pre-generated arrays
+        of up to chunk_size steps. The simulator (price and history) advances
+        one whole chunk at a time as each chunk is handed out.
+        """
+        while n_steps > 0:
+            chunk = self.simulate(min(chunk_size, n_steps))[0]
+            self.S = chunk[-1]
+            if self.history is not None:
+                self.history.extend(chunk.tolist())
+            n_steps -= len(chunk)
+            yield chunk
+
+    def iter_prices(self, n_steps, chunk_size=1024):
+        """
+        Iterate over the next n_steps prices one at a time, backed by iter_chunks.
+        """
+        for chunk in self.iter_chunks(n_steps, chunk_size):
+            yield from chunk.tolist()
+
     def get_price(self):
         """
         Get the current price.
@@ -36,6 +76,6 @@ class GBMSimulator:
 
     def get_history(self):
         """
-        Get the full price history.
+        Get the full price history (None if keep_history is off).
         """
         return self.history
@@ -1,73 +1,261 @@
+import inspect
+import math
+from collections import namedtuple
+from functools import partial
+import numpy as np
+from EventJournal import QUOTE
+from SimulationRecorder import SimulationRecorder, FILL_DTYPE
+
+# Top of book as the strategy sees it; prices are in book ticks, mid may be a half tick.
+# recent_fills is the maker's net fill over the last recorded step (positive = bought).
+BookSnapshot = namedtuple("BookSnapshot", ["best_bid", "best_ask", "bid_depth", "ask_depth", "mid",
+                                           "tick_size", "inventory", "recent_fills"])
+
+
 class MarketMaker:
-    def __init__(self, order_book, strategy, size=10):
+    def __init__(self, order_book, strategy, size=10, recorder=None, fills=None, name="market_maker"):
         """
         Parameters:
         - order_book: the OrderBook object
-        - strategy: a callable that takes (order_book, size) and returns (bid_price, ask_price)
+        - strategy: a callable that takes (snapshot, size) and returns (bid_tick, ask_tick), see BookSnapshot
         - size: quantity of each order
+        - recorder: SimulationRecorder for the per-step history (a new one by default)
+        - fills: SimulationRecorder with FILL_DTYPE rows for the per-fill history (a new one by default)
+        - name: agent name, unique within the book; the maker registers with the book under it and
+          owns its quotes by the agent ID it gets back, so its fills are dispatched straight to update_pnl
         """
         self.order_book = order_book
         self.strategy = strategy
         self.size = size
-        self.current_bid = None
+        self.current_bid = None  # Resting quote levels, in book ticks
         self.current_ask = None
-        self.realized_pnl = 0  # Track accumulated PnL
+        self.bid_order_id = None  # Book IDs of the resting quotes
+        self.ask_order_id = None
         self.inventory = 0  # Track net position
-        self.total_pnl = 0
-        self.total_pnl_hist = []
-        self.realized_pnl_hist = []
-        self.unrealized_pnl = 0
-        self.unrealized_pnl_hist = []
-
-    def update_pnl(self, price, size, side):
-        """ Updates PnL when market orders execute against the MM. """
-        if side == "buy":  # MM is selling at ask price
-            self.realized_pnl += size * price # Revenue from selling
-            self.inventory -= size  # Reduce position
-        elif side == "sell":  # MM is buying at bid price
-            self.realized_pnl -= size * price  # Cost from buying
-            self.inventory +=  size # Increase position
-
-        self.unrealized_pnl = self.inventory * (self.order_book.get_current_market_price())
-
-        self.total_pnl = self.inventory * (self.order_book.get_current_market_price()) + self.realized_pnl
-        
+        self.cash = 0.0  # Cash from fills: sales minus purchases
+        self.avg_cost = 0.0  # Average entry price of the open position (0 when flat)
+        self.realized_pnl = 0.0  # Average-cost PnL of the closed part of each position
+        self.unrealized_pnl = 0.0  # Open position marked from avg_cost to the mid
+        self.total_pnl = 0.0
+        self.mark_price = order_book.get_current_market_price()  # Mid of the last mark
+        self.spread_pnl = 0.0  # total_pnl attribution: edge against the mid at each fill ...
+        self.inventory_pnl = 0.0  # ... plus mid moves on the inventory held
+        self.step = 0  # Step the next fills belong to
+        self.step_fills = 0  # Units traded since the last recorded step
+        self.step_net_fills = 0  # Signed units traded since the last recorded step (positive = bought)
+        self.recent_fills = 0  # step_net_fills of the last recorded step
+        self.recorder = recorder if recorder is not None else SimulationRecorder()
+        self.fills = fills if fills is not None else SimulationRecorder(dtype=FILL_DTYPE)
+        self.name = name
+        self.agent_id = order_book.register_agent(name, self.update_pnl)
+
+    # Per-step history over the whole run: views onto the recorder's columns, or
+    # read back (memory-mapped for .npy) from its sink when the history is streamed
+    @property
+    def total_pnl_hist(self):
+        return np.asarray(self.recorder.history()["total_pnl"])
+
+    @property
+    def realized_pnl_hist(self):
+        return np.asarray(self.recorder.history()["realized_pnl"])
+
+    @property
+    def unrealized_pnl_hist(self):
+        return np.asarray(self.recorder.history()["unrealized_pnl"])
+
+    @property
+    def inventory_hist(self):
+        return np.asarray(self.recorder.history()["inventory"])
+
+    def record_step(self, step, price):
+        """ Marks to the book's mid, appends this step's state to the recorder and resets the step fill counters. """
+        self.mark(self.order_book.get_current_market_price())
+        book = self.order_book
+        bid = book.ticks_to_price(self.current_bid) if self.current_bid is not None else math.nan
+        ask = book.ticks_to_price(self.current_ask) if self.current_ask is not None else math.nan
+        self.recorder.append((step, price, self.inventory, self.realized_pnl, self.unrealized_pnl,
+                              self.total_pnl, bid, ask, self.step_fills, self.spread_pnl, self.inventory_pnl))
+        self.step_fills = 0
+        self.recent_fills = self.step_net_fills
+        self.step_net_fills = 0
+        self.step = step + 1
+
+    def mark(self, mid):
+        """ Marks the position to mid in O(1); the mid's move since the last mark is inventory PnL. """
+        self.inventory_pnl += self.inventory * (mid - self.mark_price)
+        self.mark_price = mid
+        self.unrealized_pnl = self.inventory * (mid - self.avg_cost)
+        self.total_pnl = self.realized_pnl + self.unrealized_pnl
+
+    def update_pnl(self, price, size, side, mid=None):
+        """
+        Books a fill when a market order executes against the MM, in O(1):
+        average-cost realized PnL for whatever the fill closes, the rest
+        added to the position's average cost, then a mark to mid (the book's
+        current mid by default; the book passes the mid the fill traded at).
+        """
+        signed = -size if side == "buy" else size  # the MM sells into market buys
+        position = self.inventory
+        # Mark first, so the fill's edge is measured against the mid it traded at
+        if mid is None:
+            mid = self.order_book.get_current_market_price()
+        self.mark(mid)
+
+        realized = 0.0
+        if position and (position > 0) != (signed > 0):
+            closed = min(size, abs(position))
+            realized = closed * (price - self.avg_cost) * (1 if position > 0 else -1)
+            self.realized_pnl += realized
+            if size > abs(position):
+                self.avg_cost = price  # flipped: the remainder opens a new position here
+            elif size == abs(position):
+                self.avg_cost = 0.0
+        else:
+            self.avg_cost = (self.avg_cost * abs(position) + price * size) / (abs(position) + size)
+
+        self.inventory = position + signed
+        self.cash -= signed * price
+        self.spread_pnl += signed * (mid - price)
+        self.step_net_fills += signed
+        self.step_fills += size
+        self.fills.append((self.step, price, size, 1 if signed > 0 else -1, mid, self.inventory, realized))
+        self.mark(mid)
+
+    def round_trips(self):
+        """
+        Realized PnL of each completed round trip, from the fill records: a
+        trip ends when the position returns to flat or flips sides. Streamed
+        fill records are read back from the sink, so the whole run counts.
+        """
+        fills = self.fills.history()
+        after = np.asarray(fills["inventory"])
+        before = after - np.asarray(fills["side"]).astype(np.int64) * np.asarray(fills["size"])
+        ends = np.nonzero((before != 0) & (np.sign(after) != np.sign(before)))[0]
+        return np.diff(np.cumsum(np.asarray(fills["realized"]))[ends], prepend=0.0)
+
+    def snapshot(self):
+        """
+        Top-of-book view handed to the strategy, built from the book's sorted
+        tick index in O(1). Returns None if either side of the book is empty.
+        """
+        book = self.order_book
+        best_bid = book.get_best_bid_tick()
+        best_ask = book.get_best_ask_tick()
+        if best_bid is None or best_ask is None:
+            return None
+        return BookSnapshot(best_bid, best_ask, book.level_size(best_bid, "buy"), book.level_size(best_ask, "sell"),
+                            (best_bid + best_ask) / 2, book.tick_size, self.inventory, self.recent_fills)
 
     def place_quotes(self):
-        if not self.order_book.bids or not self.order_book.asks:
-            return
+        """
+        Pulls the maker's resting quotes, asks the strategy for new ones against
+        the remaining book, and posts them. A quote that would cross the book is
+        pulled back one tick inside it; if the two quotes would cross each other,
+        neither is posted.
+        """
+        book = self.order_book
 
-        best_bid = max(self.order_book.bids.keys())
-        best_ask = min(self.order_book.asks.keys())
+        # Cancel old orders first (only our own), so the strategy sees the investor book
+        if self.bid_order_id is not None:
+            book.cancel_by_id(self.bid_order_id)
+        if self.ask_order_id is not None:
+            book.cancel_by_id(self.ask_order_id)
+        self.bid_order_id = self.ask_order_id = None
+        self.current_bid = self.current_ask = None
 
-        # Market maker takes whatever is available, ensuring two decimal places
-        bid_price = round(best_bid + 0.01, 2)  # Just below best ask
-        ask_price = round(best_ask - 0.01, 2)  # Just above best bid
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return  # Avoid placing quotes if the book is empty
+        bid_tick, ask_tick = self.strategy(snapshot, self.size)
+        bid_tick = int(bid_tick) if bid_tick is not None and bid_tick == bid_tick else None  # NaN: no quote
+        ask_tick = int(ask_tick) if ask_tick is not None and ask_tick == ask_tick else None
 
-        # Ensure no crossed market
-        if bid_price >= ask_price:
+        # Quotes are post-only: never trade through the opposite side
+        if bid_tick is not None:
+            bid_tick = min(bid_tick, snapshot.best_ask - 1)
+        if ask_tick is not None:
+            ask_tick = max(ask_tick, snapshot.best_bid + 1)
+        if bid_tick is not None and ask_tick is not None and bid_tick >= ask_tick:
             return  # Skip placing orders if they would cross the spread
 
-        # Cancel old orders
-        if self.current_bid is not None:
-            self.order_book.cancel_order(self.current_bid, "buy")
-        if self.current_ask is not None:
-            self.order_book.cancel_order(self.current_ask, "sell")
-
         # Place new market maker orders
-        self.order_book.add_limit_order(bid_price, self.size, "buy", owner="market_maker")
-        self.order_book.add_limit_order(ask_price, self.size, "sell", owner="market_maker")
+        journal = book.journal
+        if bid_tick is not None:
+            self.bid_order_id = book.add_limit_order_ticks(bid_tick, self.size, "buy", owner=self.agent_id)
+            self.current_bid = bid_tick
+            if journal is not None:
+                journal.record(QUOTE, "buy", self.bid_order_id, bid_tick, self.size, self.name)
+        if ask_tick is not None:
+            self.ask_order_id = book.add_limit_order_ticks(ask_tick, self.size, "sell", owner=self.agent_id)
+            self.current_ask = ask_tick
+            if journal is not None:
+                journal.record(QUOTE, "sell", self.ask_order_id, ask_tick, self.size, self.name)
+
+
+# Strategies are called as strategy(snapshot, size) with a BookSnapshot and
+# return (bid_tick, ask_tick); either may be None or NaN to leave that side
+# unquoted. They stick to arithmetic that also works elementwise, so the batch
+# engine can call them with array snapshots covering many books at once.
+# Extra parameters are bound with functools.partial, which keeps them picklable.
+
+def penny_jump_strategy(snapshot, size):
+    """ Quotes one tick inside the investor touch on both sides. """
+    return snapshot.best_bid + 1, snapshot.best_ask - 1
+
+
+def fixed_spread_strategy(snapshot, size, spread=0.10):
+    """ Quotes a fixed spread (in price units) centred on the mid. """
+    half_spread = spread / snapshot.tick_size / 2
+    return (snapshot.mid - half_spread) // 1, -((-snapshot.mid - half_spread) // 1)
+
+
+def inventory_skew_strategy(snapshot, size, spread=0.10, skew=0.002, max_inventory=None):
+    """
+    Fixed spread around a reservation price that leans against inventory:
+    the centre moves down by skew (price units) per unit held long, and up
+    per unit held short, so fills that reduce the position become more likely.
+    At max_inventory the side that would grow the position is not quoted.
+    """
+    tick_size = snapshot.tick_size
+    centre = snapshot.mid - skew * snapshot.inventory / tick_size
+    half_spread = spread / tick_size / 2
+    bid_tick, ask_tick = (centre - half_spread) // 1, -((-centre - half_spread) // 1)
+    if max_inventory is not None:
+        bid_tick = np.where(snapshot.inventory >= max_inventory, np.nan, bid_tick)
+        ask_tick = np.where(snapshot.inventory <= -max_inventory, np.nan, ask_tick)
+    return bid_tick, ask_tick
+
+
+STRATEGIES = {
+    "fixed_spread": fixed_spread_strategy,
+    "inventory_skew": inventory_skew_strategy,
+    "penny_jump": penny_jump_strategy,
+}
+
+
+def as_makers(market_maker):
+    """ A MarketMaker, or a sequence of competing makers in one book, as a tuple of makers. """
+    return tuple(market_maker) if isinstance(market_maker, (list, tuple)) else (market_maker,)
 
-        self.current_bid = bid_price
-        self.current_ask = ask_price
 
+def place_quotes_in_turn(makers, turn):
+    """ Requotes every maker, starting from a different one each turn so none always gets queue priority. """
+    first = turn % len(makers)
+    for maker in makers[first:] + makers[:first]:
+        maker.place_quotes()
 
-def fixed_spread_strategy(order_book, size, spread=0.10):
-    if not order_book.bids or not order_book.asks:
-        return None, None  # Avoid placing quotes if the book is empty
-    
-    best_bid = max(order_book.bids.keys())
-    best_ask = min(order_book.asks.keys())
-    mid_price = (best_bid + best_ask) / 2
-    return round(mid_price - spread / 2, 2), round(mid_price + spread / 2, 2)
 
+def make_strategy(name, spread=None, **params):
+    """
+    Looks up a strategy by name and binds its params. spread is the shared
+    setting every caller passes, so it is bound only if the strategy takes it
+    (penny_jump does not); any other param the strategy does not take raises ValueError.
+    """
+    strategy = STRATEGIES[name]
+    accepted = inspect.signature(strategy).parameters
+    unknown = sorted(key for key in params if key not in accepted)
+    if unknown:
+        raise ValueError(f"unknown parameter(s) for strategy {name!r}: {', '.join(unknown)}")
+    if spread is not None and "spread" in accepted:
+        params["spread"] = spread
+    return partial(strategy, **params)
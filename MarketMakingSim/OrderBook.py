@@ -1,121 +1,535 @@
+import bisect
+import operator
+import sys
+from collections import deque
+from collections.abc import Mapping
+from decimal import Decimal
 import numpy as np
+from BufferedRNG import BufferedRNG
+from EventJournal import ADD, CANCEL, AMEND, TRADE, MARKET
+
+# Agent ID of the random investors every book starts with
+INVESTOR = 0
+
+
+class Order:
+    """ A resting limit order. owner is the integer ID of the agent that placed it, see OrderBook.register_agent. """
+    __slots__ = ("id", "size", "owner", "side", "tick")
+
+    def __init__(self, order_id, size, owner, side, tick):
+        self.id = order_id
+        self.size = size
+        self.owner = owner
+        self.side = side
+        self.tick = tick
+
+    def __repr__(self):
+        return f"Order(id={self.id}, size={self.size}, owner={self.owner}, side={self.side!r}, tick={self.tick})"
+
+
+class _Level(deque):
+    """
+    FIFO queue of the Orders at one tick. A cancelled order stays where it is
+    with size 0 (a tombstone) and is skipped; tombstones are dropped when they
+    reach the front, or all at once when they outnumber the live orders.
+    """
+    __slots__ = ("dead",)
+
+    def __init__(self, orders=()):
+        super().__init__(orders)
+        self.dead = 0
+
+    def live(self):
+        return [order for order in self if order.size]
+
+    def bury(self, order):
+        """ Turns a queued order into a tombstone, compacting the queue if they now dominate it. """
+        order.size = 0
+        self.dead += 1
+        if self.dead * 2 > len(self):
+            live = self.live()
+            self.clear()
+            self.extend(live)
+            self.dead = 0
+
+
+class _PriceLevels(Mapping):
+    """ Read-only price-keyed view over one side of the tick-keyed book. """
+
+    def __init__(self, book, levels):
+        self._book = book
+        self._levels = levels
+
+    def __getitem__(self, price):
+        return self._levels[self._book.price_to_ticks(price)].live()
+
+    def __contains__(self, price):
+        return self._book.price_to_ticks(price) in self._levels
+
+    def __iter__(self):
+        to_price = self._book.ticks_to_price
+        return (to_price(tick) for tick in self._levels)
+
+    def __len__(self):
+        return len(self._levels)
+
 
 class OrderBook:
-    def __init__(self, initial_price=100.0):
-        self.bids = {}   # {price: [{"size": size, "owner": owner}]}
-        self.asks = {}  
+    def __init__(self, initial_price=100.0, tick_size=0.01, journal=None, rng=None):
+        """
+        Parameters:
+        - initial_price: price the book is seeded around
+        - tick_size: minimum price increment; levels are stored as integer multiples of it
+        - journal: optional EventJournal that receives add/cancel/amend/trade events
+        - rng: BufferedRNG used to seed the book and, by default, drive the simulated
+          investor flow around it (fresh entropy if None)
+        """
+        self.tick_size = tick_size
+        self.journal = journal
+        self.rng = rng if rng is not None else BufferedRNG()
+        self._price_decimals = max(0, -Decimal(str(tick_size)).as_tuple().exponent)
+
+        # {tick: _Level of Orders}. Each level is a FIFO deque; cancels leave
+        # tombstones behind, so removal from anywhere in it is O(1) amortized.
+        self._bids = {}
+        self._asks = {}
+        self._orders = {}  # {order_id: Order} for O(1) cancel/amend by ID
+        self._next_order_id = 0
+        # Sorted tick index (ascending) kept in step with the dicts above, so the
+        # best bid is always self._bid_ticks[-1] and the best ask self._ask_ticks[0]
+        self._bid_ticks = []
+        self._ask_ticks = []
+        # Aggregated size per level, {tick: total size}, updated on every add /
+        # cancel / amend / fill so depth queries never walk the order queues
+        self._bid_depth = {}
+        self._ask_depth = {}
+        # {side: set of ticks} whose size changed since the last depth_snapshot /
+        # depth_delta, or None until the first snapshot turns tracking on
+        self._dirty = None
+        self.bids = _PriceLevels(self, self._bids)  # {price: [orders]} views for callers
+        self.asks = _PriceLevels(self, self._asks)
         self.mid_price = initial_price
         self.initial_price = initial_price
+        # Agents by integer ID: agent_names[i] is agent i's name (for the journal) and
+        # _fill_handlers[i] its fill callback or None, so a fill is dispatched by one
+        # list index whatever the number of agents
+        self.agent_names = []
+        self._fill_handlers = []
+        self._agent_ids = {}  # {name: agent ID}
+        self.register_agent("investor")
 
+        initial_tick = self.price_to_ticks(initial_price)
         for i in range(5):
-            bid_price = round(initial_price - 0.01 * (i + 1), 2)
-            ask_price = round(initial_price + 0.01 * (i + 1), 2)
-            bid_size = np.random.randint(5, 20)
-            ask_size = np.random.randint(5, 20)
-            self.bids[bid_price] = [{"size": bid_size, "owner": "investor"}]
-            self.asks[ask_price] = [{"size": ask_size, "owner": "investor"}]
+            bid_size = self.rng.integers(5, 20)
+            ask_size = self.rng.integers(5, 20)
+            self.add_limit_order_ticks(initial_tick - (i + 1), bid_size, "buy")
+            self.add_limit_order_ticks(initial_tick + (i + 1), ask_size, "sell")
 
         self.update_mid_price()
 
+    def register_agent(self, name, on_fill=None):
+        """
+        Registers an agent that places orders in the book and returns its
+        integer agent ID, to pass as the owner of its orders. Whenever one of
+        its orders trades, on_fill(price, size, side, mid) is called with the
+        fill price, the traded size, the side of the market order and the mid
+        before that order. Handlers run once the market order has fully
+        executed, so they may add, cancel or amend orders.
+        """
+        name = sys.intern(name)
+        if name in self._agent_ids:
+            raise ValueError(f"an agent named {name!r} is already registered")
+        agent_id = self._agent_ids[name] = len(self.agent_names)
+        self.agent_names.append(name)
+        self._fill_handlers.append(on_fill)
+        return agent_id
+
+    def agent_id(self, owner):
+        """
+        The agent ID for an owner given as an ID or a name; unknown names are
+        registered without a fill handler. Raises ValueError for an ID that is
+        not registered (or a bool), before anything reaches the book.
+        """
+        if isinstance(owner, (bool, np.bool_)):
+            raise ValueError(f"owner must be an agent ID or name, not {owner!r}")
+        try:
+            agent_id = operator.index(owner)  # int or any integer type, e.g. np.int64
+        except TypeError:
+            pass
+        else:
+            if not 0 <= agent_id < len(self.agent_names):
+                raise ValueError(f"no agent with ID {agent_id} is registered")
+            return agent_id
+        agent_id = self._agent_ids.get(owner)
+        return agent_id if agent_id is not None else self.register_agent(owner)
+
+    def price_to_ticks(self, price):
+        """ Converts a price to the nearest whole number of ticks. """
+        return int(round(price / self.tick_size))
+
+    def ticks_to_price(self, ticks):
+        """ Converts a tick count back to a price on the tick grid. """
+        return round(ticks * self.tick_size, self._price_decimals)
+
+    def _side(self, side):
+        """ Returns the (levels, sorted ticks) pair for a side of the book. """
+        if side == "buy":
+            return self._bids, self._bid_ticks
+        return self._asks, self._ask_ticks
+
+    def _depth(self, side):
+        """ Returns the {tick: aggregated size} dict for a side of the book. """
+        return self._bid_depth if side == "buy" else self._ask_depth
+
+    def _remove_level(self, side, tick):
+        book, ticks = self._side(side)
+        del book[tick]
+        del ticks[bisect.bisect_left(ticks, tick)]
+        del self._depth(side)[tick]
+        if self._dirty is not None:
+            self._dirty[side].add(tick)
+
+    def get_best_bid_tick(self):
+        """ Highest bid in ticks, or None if there are no bids. """
+        return self._bid_ticks[-1] if self._bid_ticks else None
+
+    def get_best_ask_tick(self):
+        """ Lowest ask in ticks, or None if there are no asks. """
+        return self._ask_ticks[0] if self._ask_ticks else None
+
+    def get_best_bid(self):
+        """ Highest bid price, or None if there are no bids. """
+        return self.ticks_to_price(self._bid_ticks[-1]) if self._bid_ticks else None
+
+    def get_best_ask(self):
+        """ Lowest ask price, or None if there are no asks. """
+        return self.ticks_to_price(self._ask_ticks[0]) if self._ask_ticks else None
+
+    def level_size(self, tick, side):
+        """ Total size resting at one level (0 if the level is empty). """
+        return self._depth(side).get(tick, 0)
+
+    def top_levels(self, n=10):
+        """
+        Top n levels of each side as (bids, asks) lists of (tick, size), best
+        first. Costs O(n) whatever the book's size.
+        """
+        bids = [(tick, self._bid_depth[tick]) for tick in self._bid_ticks[:-n - 1:-1]]
+        asks = [(tick, self._ask_depth[tick]) for tick in self._ask_ticks[:n]]
+        return bids, asks
+
+    def depth_snapshot(self, n=10):
+        """
+        top_levels(n), also marking the point that depth_delta reports
+        changes from. The first call turns change tracking on.
+        """
+        self._dirty = {"buy": set(), "sell": set()}
+        return self.top_levels(n)
+
+    def depth_delta(self):
+        """
+        Levels changed since the last depth_snapshot / depth_delta, as
+        (bids, asks) dicts of {tick: new size}, where 0 means the level is
+        gone. Applying them to a snapshot (or to the full depth) brings it up
+        to date. Both dicts are empty if no snapshot has been taken yet.
+        """
+        if self._dirty is None:
+            return {}, {}
+        bids = {tick: self._bid_depth.get(tick, 0) for tick in self._dirty["buy"]}
+        asks = {tick: self._ask_depth.get(tick, 0) for tick in self._dirty["sell"]}
+        self._dirty = {"buy": set(), "sell": set()}
+        return bids, asks
+
     def update_mid_price(self):
-        if self.bids and self.asks:
-            best_bid = max(self.bids.keys())
-            best_ask = min(self.asks.keys())
-            self.mid_price = (best_bid + best_ask) / 2
+        if self._bid_ticks and self._ask_ticks:
+            self.mid_price = (self._bid_ticks[-1] + self._ask_ticks[0]) * self.tick_size / 2
+
+    def add_limit_order_ticks(self, tick, size, side, owner=INVESTOR):
+        """ Queues a limit order at the back of its level and returns its order ID. owner is an agent ID or name. """
+        owner = self.agent_id(owner)
+        book, ticks = self._side(side)
+        level = book.get(tick)
+        if level is None:
+            level = book[tick] = _Level()
+            bisect.insort(ticks, tick)
 
-    def add_limit_order(self, price, size, side, owner="investor"):
-        book = self.bids if side == "buy" else self.asks
-        if price not in book:
-            book[price] = []
-        
-        book[price].append({"size": size, "owner": owner})
+        order_id = self._next_order_id
+        self._next_order_id += 1
+        order = Order(order_id, size, owner, side, tick)
+        level.append(order)
+        self._orders[order_id] = order
+        depth = self._depth(side)
+        depth[tick] = depth.get(tick, 0) + size
+        if self._dirty is not None:
+            self._dirty[side].add(tick)
+        if self.journal is not None:
+            self.journal.record(ADD, side, order_id, tick, size, self.agent_names[owner])
+        return order_id
 
+    def add_limit_orders_ticks(self, ticks, sizes, side, owner=INVESTOR):
+        """ Bulk add_limit_order_ticks for parallel sequences of ticks and sizes. Returns the new IDs. """
+        book, sorted_ticks = self._side(side)
+        depth = self._depth(side)
+        orders = self._orders
+        journal = self.journal
+        owner = self.agent_id(owner)
+        owner_name = self.agent_names[owner]
+        first_id = order_id = self._next_order_id
+
+        for tick, size in zip(ticks, sizes):
+            level = book.get(tick)
+            if level is None:
+                level = book[tick] = _Level()
+                bisect.insort(sorted_ticks, tick)
+            order = Order(order_id, size, owner, side, tick)
+            level.append(order)
+            orders[order_id] = order
+            depth[tick] = depth.get(tick, 0) + size
+            if journal is not None:
+                journal.record(ADD, side, order_id, tick, size, owner_name)
+            order_id += 1
+
+        self._next_order_id = order_id
+        if self._dirty is not None:
+            self._dirty[side].update(ticks)
+        return range(first_id, order_id)
+
+    def add_limit_order(self, price, size, side, owner=INVESTOR):
+        return self.add_limit_order_ticks(self.price_to_ticks(price), size, side, owner)
+
+    def get_order(self, order_id):
+        """ Returns the resting Order for an ID, or None if it is no longer in the book. """
+        return self._orders.get(order_id)
+
+    def cancel_by_id(self, order_id):
+        """
+        Cancels a single resting order, leaving every other order at its level
+        in place. Returns False if the order was already filled or cancelled.
+        """
+        order = self._orders.pop(order_id, None)
+        if order is None:
+            return False
+        side, tick, size = order.side, order.tick, order.size
+        if self.journal is not None:
+            self.journal.record(CANCEL, side, order_id, tick, size, self.agent_names[order.owner])
+        depth = self._depth(side)
+        if depth[tick] == size:  # last live order at the level
+            self._remove_level(side, tick)
+            self.update_mid_price()
+        else:
+            depth[tick] -= size
+            self._side(side)[0][tick].bury(order)
+            if self._dirty is not None:
+                self._dirty[side].add(tick)
+        return True
+
+    def amend_order(self, order_id, new_size):
+        """
+        Changes the size of a resting order. A size reduction keeps the order's
+        queue position; an increase sends it to the back of its level, and a
+        size of zero or less cancels it. Returns False if the order is gone.
+        """
+        if new_size <= 0:
+            return self.cancel_by_id(order_id)
+        order = self._orders.get(order_id)
+        if order is None:
+            return False
+        side, tick = order.side, order.tick
+        if new_size > order.size:
+            # Moving to the back is O(level length); size increases are rare
+            level = self._side(side)[0][tick]
+            level.remove(order)
+            level.append(order)
+        self._depth(side)[tick] += new_size - order.size
+        if self._dirty is not None:
+            self._dirty[side].add(tick)
+        order.size = new_size
+        if self.journal is not None:
+            self.journal.record(AMEND, side, order_id, tick, new_size, self.agent_names[order.owner])
+        return True
+
+    def cancel_order_ticks(self, tick, side):
+        """ Cancels every order resting at a level. """
+        book, _ = self._side(side)
+        if tick in book:
+            for order in book[tick].live():
+                del self._orders[order.id]
+                if self.journal is not None:
+                    self.journal.record(CANCEL, side, order.id, tick, order.size, self.agent_names[order.owner])
+            self._remove_level(side, tick)
+        self.update_mid_price()
 
     def cancel_order(self, price, side):
-        book = self.bids if side == "buy" else self.asks
-        if price in book:
-            del book[price]
+        self.cancel_order_ticks(self.price_to_ticks(price), side)
+
+    def band_ticks(self, price, band):
+        """
+        First and last tick whose price is within band (a fraction) of price,
+        by the same rounded-price test as abs(p - price) / price <= band.
+        Returns low > high if no tick is that close.
+        """
+        def live(tick):
+            return abs(self.ticks_to_price(tick) - price) / price <= band
+
+        low, high = self.price_to_ticks(price * (1 - band)), self.price_to_ticks(price * (1 + band))
+        while live(low - 1):
+            low -= 1
+        while low <= high and not live(low):
+            low += 1
+        while live(high + 1):
+            high += 1
+        while high >= low and not live(high):
+            high -= 1
+        return low, high
+
+    def prune_outside(self, low, high, side=None):
+        """
+        Cancels every level below tick low or above tick high, on one side or
+        on both if side is None. The levels to drop are found by bisecting the
+        sorted index, so the cost is O(log n) plus the removed orders, and the
+        mid is updated once at the end. Returns the number of levels removed.
+        """
+        removed = 0
+        journal = self.journal
+        for name in (("buy", "sell") if side is None else (side,)):
+            book, ticks = self._side(name)
+            depth = self._depth(name)
+            lo = bisect.bisect_left(ticks, low)
+            hi = max(bisect.bisect_right(ticks, high), lo)
+            stale = ticks[:lo] + ticks[hi:]
+            for tick in stale:
+                for order in book.pop(tick).live():
+                    del self._orders[order.id]
+                    if journal is not None:
+                        journal.record(CANCEL, name, order.id, tick, order.size, self.agent_names[order.owner])
+                del depth[tick]
+            if self._dirty is not None:
+                self._dirty[name].update(stale)
+            del ticks[hi:]
+            del ticks[:lo]
+            removed += len(stale)
         self.update_mid_price()
+        return removed
 
-    def execute_market_order(self, size, side, market_maker = None):
+    def execute_market_order(self, size, side):
         """
         Executes a market order, prioritizing price levels and reducing order sizes.
-        Tracks whether the market maker's orders are filled.
+        Each fill is passed to the fill handler of the resting order's agent, if it has
+        one, after the sweep, so handlers always see a consistent book.
         """
-        book = self.asks if side == "buy" else self.bids
-        price_levels = sorted(book.keys()) if side == "buy" else sorted(book.keys(), reverse=True)
+        # A buy walks the asks upwards from the front of the index, a sell walks
+        # the bids downwards from the back; no re-sorting is needed either way.
+        resting_side = "sell" if side == "buy" else "buy"
+        book, ticks = self._side(resting_side)
+        depth = self._depth(resting_side)
+        dirty = self._dirty[resting_side] if self._dirty is not None else None
+        journal = self.journal
+        fill_handlers = self._fill_handlers
 
-        print(f"Market Order Size: {size}")
+        if journal is not None:
+            journal.record(MARKET, side, -1, 0, size, "market")
 
         remaining = size
-        market_maker_fills = 0  # Track market maker fills
+        levels_cleared = 0
+        fills = None  # (handler, tick, size) per fill of an agent with a handler
+        mid = None
 
+        while remaining > 0 and levels_cleared < len(ticks):
+            tick = ticks[levels_cleared] if side == "buy" else ticks[-1 - levels_cleared]
 
-        for price in price_levels:
-            if remaining <= 0:
-                break
-            
-            # Execute orders at this price level
-            new_orders = []
-            for order in book[price]:  # Loop through orders at this price
-                available = order["size"]  # Extract integer size
-                trade_size = min(available, remaining)
-                order["size"] -= trade_size
+            # Execute orders at this price level in FIFO order, consuming the queue in place
+            level = book[tick]
+            left = depth[tick]
+            while remaining > 0 and left:
+                order = level[0]
+                order_size = order.size
+                if not order_size:  # tombstone of a cancelled order
+                    level.popleft()
+                    level.dead -= 1
+                    continue
+                trade_size = order_size if order_size < remaining else remaining
+                order.size = order_size - trade_size
                 remaining -= trade_size
+                left -= trade_size
+
+                if journal is not None:
+                    journal.record(TRADE, resting_side, order.id, tick, trade_size, self.agent_names[order.owner])
 
-                # Track market maker fills
-                if market_maker and order["owner"] == "market_maker":
-                    market_maker_fills += trade_size
-                    market_maker.update_pnl(price, trade_size, side)
+                # Attribute the fill to its agent by ID
+                on_fill = fill_handlers[order.owner]
+                if on_fill is not None:
+                    if fills is None:
+                        fills = []
+                        mid = self.get_current_market_price()  # the index is untouched until the sweep ends
+                    fills.append((on_fill, tick, trade_size))
 
-                # If there's remaining size, keep the order
-                if order["size"] > 0:
-                    new_orders.append(order)
+                # Fully filled orders leave the queue
+                if not order.size:
+                    level.popleft()
+                    del self._orders[order.id]
+
+            if dirty is not None:
+                dirty.add(tick)
+            # Remove the price level once nothing live is left in it
+            if left:
+                depth[tick] = left
+                break
+            del book[tick]
+            del depth[tick]
+            levels_cleared += 1
 
-            # Update or remove price level
-            if new_orders:
-                book[price] = new_orders
+        # Drop every fully consumed level from the index in one slice
+        if levels_cleared:
+            if side == "buy":
+                del ticks[:levels_cleared]
             else:
-                del book[price]
+                del ticks[-levels_cleared:]
 
         self.update_mid_price()
-
-        # Print fill information for debugging
-        if market_maker_fills > 0:
-            print(f"✅ Market Maker filled {market_maker_fills} units on {side} market order.")
+        if fills is not None:
+            for on_fill, tick, trade_size in fills:
+                on_fill(self.ticks_to_price(tick), trade_size, side, mid)
 
 
     def get_current_market_price(self): # mid price
         """ Estimates the current market price based on the best available bid/ask. """
-        if self.bids and self.asks:
-            return (max(self.bids.keys()) + min(self.asks.keys())) / 2  # Mid-price
-        elif self.bids:  # No asks, use best bid
-            return max(self.bids.keys())
-        elif self.asks:  # No bids, use best ask
-            return min(self.asks.keys())
+        if self._bid_ticks and self._ask_ticks:
+            return (self._bid_ticks[-1] + self._ask_ticks[0]) * self.tick_size / 2  # Mid-price
+        elif self._bid_ticks:  # No asks, use best bid
+            return self.ticks_to_price(self._bid_ticks[-1])
+        elif self._ask_ticks:  # No bids, use best ask
+            return self.ticks_to_price(self._ask_ticks[0])
         return self.mid_price
 
+    def get_ladder(self, half_width, center_tick=None):
+        """
+        Dense view of resting size around a center tick (the mid by default).
+        Returns (first_tick, bid_sizes, ask_sizes) where index i of each array
+        holds the total size resting at first_tick + i.
+        """
+        if center_tick is None:
+            center_tick = self.price_to_ticks(self.mid_price)
+        first_tick = center_tick - half_width
+        bid_sizes = np.zeros(2 * half_width + 1, dtype=np.int64)
+        ask_sizes = np.zeros(2 * half_width + 1, dtype=np.int64)
+
+        for ladder, depth, ticks in ((bid_sizes, self._bid_depth, self._bid_ticks),
+                                     (ask_sizes, self._ask_depth, self._ask_ticks)):
+            lo = bisect.bisect_left(ticks, first_tick)
+            hi = bisect.bisect_right(ticks, center_tick + half_width)
+            for tick in ticks[lo:hi]:
+                ladder[tick - first_tick] = depth[tick]
 
+        return first_tick, bid_sizes, ask_sizes
 
-    def display_book(self):
-        """Displays the order book in a structured table format."""
+    def display_book(self, levels=10):
+        """ Prints the top `levels` levels of each side with their aggregated size. """
+        bids, asks = self.top_levels(levels)
         print("\nOrder Book Snapshot:")
-        print(f"{'Price':<10} {'Ask Size (Owner)':<20} {'Bid Size (Owner)':<20}")
-        print("-" * 50)
-
-        all_prices = sorted(set(self.bids.keys()) | set(self.asks.keys()), reverse=True)  # Fix: Use self.bids, self.asks
-
-        for price in all_prices:
-            ask_str = " - "
-            bid_str = " - "
-            
-            if price in self.asks:
-                ask_orders = [f"{order['size']} ({order['owner']})" for order in self.asks[price]]
-                ask_str = ", ".join(ask_orders)
-            
-            if price in self.bids:
-                bid_orders = [f"{order['size']} ({order['owner']})" for order in self.bids[price]]
-                bid_str = ", ".join(bid_orders)
-            
-            print(f"{price:<10} {ask_str:<20} {bid_str:<20}")
-        print("-" * 50)
+        print(f"{'Price':<10} {'Ask Size':<12} {'Bid Size':<12}")
+        print("-" * 34)
+        for tick, size in reversed(asks):
+            print(f"{self.ticks_to_price(tick):<10} {size:<12} {'-':<12}")
+        for tick, size in bids:
+            print(f"{self.ticks_to_price(tick):<10} {'-':<12} {size:<12}")
+        print("-" * 34)
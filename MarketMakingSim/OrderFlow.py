@@ -0,0 +1,183 @@
+import numpy as np
+
+_NO_LEVEL = -(1 << 40)  # sentinel tick for an empty side, far below any real level
+
+
+def resolve_passive_sides(drawn, aggressive, valid, best, limit):
+    """
+    Resolves one side's batch of investor limit orders for many books at once,
+    in the buy-side orientation (higher is better). Row k holds book k's orders
+    in submission order; each row is resolved as if its orders were submitted
+    one at a time: an aggressive order improves the running best by one tick,
+    any other order rests at its drawn tick, and an order is dropped if it would
+    reach `limit` or beyond.
+
+    Parameters:
+    - drawn: (K, n) int array of drawn ticks
+    - aggressive: (K, n) bool array, True where the order tries to improve the best
+    - valid: (K, n) bool array masking real orders (rows may hold fewer than n)
+    - best: (K,) best tick per book before the batch, _NO_LEVEL for an empty side
+    - limit: (K,) first tick that would cross (the opposite best), or None for no limit
+
+    Returns (ticks, accepted) where accepted masks the orders that rest.
+    """
+    n = drawn.shape[1]
+    best = np.asarray(best, dtype=np.int64)[:, None]
+    cap = (np.asarray(limit, dtype=np.int64) - 1)[:, None] if limit is not None else np.iinfo(np.int64).max
+    passive_ok = valid & (drawn <= cap)
+
+    aggressive = aggressive & valid
+    empty = best[:, 0] == _NO_LEVEL
+    if n and empty.any():
+        # Nothing to improve on until the first order lands; that order rests at
+        # its drawn tick even if it was flagged aggressive.
+        first = np.where(passive_ok.any(axis=1), passive_ok.argmax(axis=1), n)
+        aggressive &= ~(empty[:, None] & (np.arange(n) <= first[:, None]))
+
+    # Running best before capping: every aggressive order adds one tick, every
+    # passive order can lift it to its own tick. With A the inclusive count of
+    # aggressive orders, best_k = A_k + max(best, max_{j<=k} (v_j - A_j)); capping
+    # at `cap` commutes with both operations, so it is applied once at the end.
+    bumps = np.cumsum(aggressive, axis=1)
+    candidates = np.where(~aggressive & passive_ok, drawn, _NO_LEVEL) - bumps
+    uncapped = bumps + np.maximum(np.maximum.accumulate(candidates, axis=1), best)
+    running_best = np.minimum(uncapped, cap)
+
+    previous_best = np.empty(drawn.shape, dtype=np.int64)
+    previous_best[:, :1] = best
+    previous_best[:, 1:] = running_best[:, :-1]
+
+    ticks = np.where(aggressive, previous_best + 1, drawn)
+    accepted = np.where(aggressive, previous_best < cap, passive_ok)
+    return ticks, accepted
+
+
+def resolve_passive_side(drawn, aggressive, best, limit):
+    """
+    Single-book resolve_passive_sides for 1-D drawn / aggressive arrays, where
+    best and limit are ticks or None for an empty side.
+    Returns (ticks, accepted) where accepted masks the orders that rest.
+    """
+    ticks, accepted = resolve_passive_sides(drawn[None], aggressive[None], np.ones((1, len(drawn)), dtype=bool),
+                                            [best if best is not None else _NO_LEVEL],
+                                            [limit] if limit is not None else None)
+    return ticks[0], accepted[0]
+
+
+def _resolve_orders(drawn, sizes, aggressive, best, limit):
+    """
+    Scalar resolve_passive_side over plain lists, for the single-book loop
+    where a short Python pass beats the array setup: same rules and results,
+    in the buy-side orientation. Returns the (ticks, sizes) of the orders that rest.
+    """
+    ticks, kept = [], []
+    for tick, size, bump in zip(drawn, sizes, aggressive):
+        if bump and best is not None:
+            tick = best + 1
+        if limit is not None and tick >= limit:
+            continue
+        if best is None or tick > best:
+            best = tick
+        ticks.append(tick)
+        kept.append(size)
+    return ticks, kept
+
+
+class OrderFlow:
+    def __init__(self, rng, bid_count=(10, 20), ask_count=(10, 20), size_range=(5, 20),
+                 bid_level=0.99, ask_level=1.01, price_scale=0.05, aggressive_prob=0.20):
+        """
+        Random investor limit-order flow around the GBM price.
+
+        Parameters:
+        - rng: BufferedRNG the flow draws from
+        - bid_count / ask_count: [low, high) range of orders per side per step
+        - size_range: [low, high) range of order sizes
+        - bid_level / ask_level: order prices are centred on true_price * level
+        - price_scale: standard deviation of order prices around that centre
+        - aggressive_prob: chance an order improves the best price by one tick instead
+        """
+        self.rng = rng
+        self.bid_count = bid_count
+        self.ask_count = ask_count
+        self.size_range = size_range
+        self.bid_level = bid_level
+        self.ask_level = ask_level
+        self.price_scale = price_scale
+        self.aggressive_prob = aggressive_prob
+
+    def draw(self, true_price, tick_size, side):
+        """ Draws one side's orders for a step as (ticks, sizes, aggressive) arrays. """
+        rng = self.rng
+        low, high = self.bid_count if side == "buy" else self.ask_count
+        level = self.bid_level if side == "buy" else self.ask_level
+        n = rng.integers(low, high)
+        ticks = np.rint(rng.normal(true_price * level, self.price_scale, n) / tick_size).astype(np.int64)
+        sizes = rng.integers(self.size_range[0], self.size_range[1], n)
+        aggressive = rng.random(n) < self.aggressive_prob
+        return ticks, sizes, aggressive
+
+    def submit_order(self, order_book, true_price, side):
+        """
+        Draws and submits a single investor limit order, with the same rules
+        as a batch: an aggressive order improves its side's best by one tick,
+        and an order that would cross is dropped. Returns the order ID or None.
+        """
+        rng = self.rng
+        level = self.bid_level if side == "buy" else self.ask_level
+        tick = order_book.price_to_ticks(rng.normal(true_price * level, self.price_scale))
+        size = rng.integers(self.size_range[0], self.size_range[1])
+        aggressive = rng.random() < self.aggressive_prob
+
+        best_bid, best_ask = order_book.get_best_bid_tick(), order_book.get_best_ask_tick()
+        if side == "buy":
+            if aggressive and best_bid is not None:
+                tick = best_bid + 1
+            if best_ask is not None and tick >= best_ask:
+                return None
+        else:
+            if aggressive and best_ask is not None:
+                tick = best_ask - 1
+            if best_bid is not None and tick <= best_bid:
+                return None
+        return order_book.add_limit_order_ticks(tick, size, side)
+
+    def draw_batch(self, true_prices, tick_size, side):
+        """
+        draw for K books at once. Returns (ticks, sizes, aggressive, valid) as
+        (K, n) arrays, where n is the largest possible count and valid masks
+        each book's actual orders. Needs a numpy Generator as rng.
+        """
+        rng = self.rng
+        low, high = self.bid_count if side == "buy" else self.ask_count
+        level = self.bid_level if side == "buy" else self.ask_level
+        k, n = len(true_prices), high - 1
+        counts = rng.integers(low, high, k)
+        ticks = np.rint(rng.normal((true_prices * level)[:, None], self.price_scale, (k, n)) / tick_size).astype(np.int64)
+        sizes = rng.integers(self.size_range[0], self.size_range[1], (k, n))
+        aggressive = rng.random((k, n)) < self.aggressive_prob
+        return ticks, sizes, aggressive, np.arange(n) < counts[:, None]
+
+    def submit(self, order_book, true_price):
+        """
+        Generates this step's investor limit orders (bids first, then asks),
+        drops the ones that would cross, and bulk-inserts the rest. Orders are
+        drawn as arrays but resolved with the scalar _resolve_orders: for one
+        book's 10-20 orders that is cheaper than resolve_passive_side, which
+        pays off across the many books of BatchSimulator.
+        """
+        tick_size = order_book.tick_size
+
+        ticks, sizes, aggressive = self.draw(true_price, tick_size, "buy")
+        ticks, sizes = _resolve_orders(ticks.tolist(), sizes.tolist(), aggressive.tolist(),
+                                       order_book.get_best_bid_tick(), order_book.get_best_ask_tick())
+        order_book.add_limit_orders_ticks(ticks, sizes, "buy")
+
+        # Asks are resolved in the negated tick space, where lower prices are better
+        ticks, sizes, aggressive = self.draw(true_price, tick_size, "sell")
+        best_ask = order_book.get_best_ask_tick()
+        best_bid = order_book.get_best_bid_tick()
+        ticks, sizes = _resolve_orders((-ticks).tolist(), sizes.tolist(), aggressive.tolist(),
+                                       -best_ask if best_ask is not None else None,
+                                       -best_bid if best_bid is not None else None)
+        order_book.add_limit_orders_ticks([-tick for tick in ticks], sizes, "sell")
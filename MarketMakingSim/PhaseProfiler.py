@@ -0,0 +1,148 @@
+import argparse
+import cProfile
+import csv
+import io
+import json
+import pstats
+import sys
+import time
+import numpy as np
+from SimulationRecorder import SimulationRecorder
+
+# Phases of one iter_simulation step, in loop order
+PHASES = ("gbm", "cancel", "limit_orders", "quotes", "market_orders", "record")
+
+
+class PhaseProfiler:
+    def __init__(self, phases=PHASES, per_step=False, cprofile=False):
+        """
+        Opt-in timing of the simulation loop. The loop calls lap(phase) at the
+        end of each phase, which charges the time since the previous lap to
+        that phase with perf_counter_ns, and end_step() once per step.
+
+        Parameters:
+        - phases: phase names, in loop order
+        - per_step: also keep every step's time per phase (for percentiles), in step_history
+        - cprofile: run cProfile over the profiled loop as well, for a function-level view
+        """
+        self.phases = tuple(phases)
+        self._index = {phase: i for i, phase in enumerate(self.phases)}
+        self.total_ns = [0] * len(self.phases)
+        self.calls = [0] * len(self.phases)
+        self.steps = 0
+        self._last = None
+        self._step_ns = [0] * len(self.phases) if per_step else None
+        self.step_history = (SimulationRecorder(dtype=np.dtype([(phase, np.int64) for phase in self.phases]))
+                             if per_step else None)
+        self.profile = cProfile.Profile() if cprofile else None
+
+    def start(self):
+        """ Starts (or resumes) timing; time while stopped is not charged to any phase. """
+        if self.profile is not None:
+            self.profile.enable()
+        self._last = time.perf_counter_ns()
+
+    def stop(self):
+        if self.profile is not None:
+            self.profile.disable()
+        self._last = None
+
+    def lap(self, phase):
+        """ Charges the time since the last lap (or start) to phase. """
+        now = time.perf_counter_ns()
+        i = self._index[phase]
+        elapsed = now - self._last
+        self._last = now
+        self.total_ns[i] += elapsed
+        self.calls[i] += 1
+        if self._step_ns is not None:
+            self._step_ns[i] += elapsed
+
+    def end_step(self):
+        self.steps += 1
+        if self._step_ns is not None:
+            self.step_history.append(tuple(self._step_ns))
+            self._step_ns = [0] * len(self.phases)
+
+    def breakdown(self):
+        """
+        One dict per phase: total_ms, share of the profiled time, calls and
+        mean_us per call, plus p50_us / p99_us per step if per_step is on.
+        """
+        total = sum(self.total_ns) or 1
+        rows = []
+        for i, phase in enumerate(self.phases):
+            row = {"phase": phase, "total_ms": self.total_ns[i] / 1e6, "share": self.total_ns[i] / total,
+                   "calls": self.calls[i], "mean_us": self.total_ns[i] / 1e3 / max(self.calls[i], 1)}
+            if self.step_history is not None and len(self.step_history):
+                p50, p99 = np.percentile(self.step_history[phase], [50, 99]) / 1e3
+                row.update(p50_us=float(p50), p99_us=float(p99))
+            rows.append(row)
+        return rows
+
+    def cprofile_stats(self, top=15, sort="cumulative"):
+        """ The top functions from cProfile as text, or None if cProfile is off. """
+        if self.profile is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats(sort).print_stats(top)
+        return out.getvalue()
+
+    def report(self, file=None, top=15):
+        """ Prints the phase breakdown (and the cProfile top functions, if on). """
+        file = file or sys.stdout
+        rows = self.breakdown()
+        total_ms = sum(row["total_ms"] for row in rows)
+        print(f"\nPhase breakdown over {self.steps:,} steps ({total_ms:,.1f} ms)", file=file)
+        print(f"{'Phase':<15} {'Total ms':>10} {'Share':>7} {'Calls':>9} {'Mean us':>9}", file=file)
+        print("-" * 54, file=file)
+        for row in rows:
+            line = (f"{row['phase']:<15} {row['total_ms']:>10,.1f} {row['share']:>7.1%} {row['calls']:>9,} "
+                    f"{row['mean_us']:>9.2f}")
+            if "p99_us" in row:
+                line += f"  p50 {row['p50_us']:.2f}  p99 {row['p99_us']:.2f}"
+            print(line, file=file)
+        stats = self.cprofile_stats(top)
+        if stats:
+            print(stats, file=file)
+
+    def export(self, path):
+        """
+        Writes the breakdown to path: CSV for a .csv path, JSON otherwise. With
+        cProfile on, the raw profile also goes to path's stem + ".prof" (for pstats / snakeviz).
+        """
+        rows = self.breakdown()
+        if path.lower().endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(path, "w") as f:
+                json.dump({"steps": self.steps, "phases": rows}, f, indent=2)
+        if self.profile is not None:
+            self.profile.dump_stats(path.rsplit(".", 1)[0] + ".prof")
+
+
+def main(argv=None):
+    from simulation_generator import build_simulation, run_simulation
+
+    parser = argparse.ArgumentParser(description="Phase breakdown of the simulation loop")
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--strategy", default="fixed_spread")
+    parser.add_argument("--per-step", action="store_true", help="keep per-step times for percentiles")
+    parser.add_argument("--cprofile", action="store_true", help="also capture a cProfile profile")
+    parser.add_argument("--output", help="export the breakdown to this .json / .csv path")
+    args = parser.parse_args(argv)
+
+    gbm, order_book, market_maker = build_simulation(num_steps=args.steps, seed=args.seed, strategy=args.strategy)
+    profiler = PhaseProfiler(per_step=args.per_step, cprofile=args.cprofile)
+    run_simulation(gbm, order_book, market_maker, args.steps, profiler=profiler)
+    profiler.report()
+    if args.output:
+        profiler.export(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import os
+import numpy as np
+
+STEP_DTYPE = np.dtype([
+    ("step", np.int64),
+    ("price", np.float64),           # GBM (true) price
+    ("inventory", np.int64),
+    ("realized_pnl", np.float64),
+    ("unrealized_pnl", np.float64),
+    ("total_pnl", np.float64),
+    ("bid", np.float64),             # market maker quotes, NaN when not quoting
+    ("ask", np.float64),
+    ("fills", np.int64),             # units the market maker traded during the step
+    ("spread_pnl", np.float64),      # PnL attribution: edge captured against the mid at each fill
+    ("inventory_pnl", np.float64),   # ... and mid moves on the inventory held; the two sum to total_pnl
+])
+
+# One row per market maker fill
+FILL_DTYPE = np.dtype([
+    ("step", np.int64),
+    ("price", np.float64),
+    ("size", np.int64),
+    ("side", np.int8),               # +1 the maker bought, -1 it sold
+    ("mid", np.float64),             # book mid the fill was marked against
+    ("inventory", np.int64),         # position after the fill
+    ("realized", np.float64),        # average-cost PnL realized by the fill
+])
+
+# Magic string and version of the .npy files NpyFileSink writes
+_NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+
+class SimulationRecorder:
+    def __init__(self, chunk_size=4096, dtype=STEP_DTYPE, sink=None):
+        """
+        Columnar per-step history: one row per step in a preallocated
+        structured array that grows chunk_size rows at a time.
+
+        With a sink, memory stays bounded instead: each full chunk is handed
+        to the sink and the buffer is reused. The columns and data then cover
+        only the rows since the last flush, while len() still counts every
+        row recorded; history() reads the run back from the sink.
+
+        Parameters:
+        - chunk_size: rows allocated up front and added on each growth (flushed at once with a sink)
+        - dtype: structured row type
+        - sink: optional object with write(rows), read() and close() methods, e.g. NpyFileSink or ParquetSink
+        """
+        self.chunk_size = chunk_size
+        self._data = np.zeros(chunk_size, dtype=dtype)
+        self._n = 0
+        self.sink = sink
+        self.flushed = 0  # Rows handed to the sink so far
+
+    def __getstate__(self):
+        # Only the filled rows are pickled; the spare capacity is rebuilt on load
+        state = self.__dict__.copy()
+        state["_data"] = self._data[:self._n].copy()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        data = self._data
+        self._data = np.zeros(len(data) + self.chunk_size, dtype=data.dtype)
+        self._data[:len(data)] = data
+
+    def __len__(self):
+        return self.flushed + self._n
+
+    def __getitem__(self, column):
+        """ Zero-copy view of one column over the rows held in memory. """
+        return self._data[column][:self._n]
+
+    @property
+    def columns(self):
+        return self._data.dtype.names
+
+    @property
+    def data(self):
+        """ Rows held in memory as a structured array view. """
+        return self._data[:self._n]
+
+    def append(self, row):
+        """ Appends one row given as a tuple in dtype field order. """
+        if self._n == len(self._data):
+            if self.sink is not None:
+                self.flush()
+            else:
+                grown = np.zeros(len(self._data) + self.chunk_size, dtype=self._data.dtype)
+                grown[:self._n] = self._data
+                self._data = grown
+        self._data[self._n] = row
+        self._n += 1
+
+    def flush(self):
+        """ Hands the rows held in memory to the sink; a no-op without one. """
+        if self.sink is None or not self._n:
+            return
+        self.sink.write(self._data[:self._n])
+        self.flushed += self._n
+        self._n = 0
+
+    def close(self):
+        self.flush()
+        if self.sink is not None:
+            self.sink.close()
+
+    def history(self, start=0):
+        """
+        Rows from row number start on: read back lazily from the sink (after a
+        flush), or from memory without one, where rows already flushed are gone.
+        """
+        if self.sink is None:
+            return self._data[max(start - self.flushed, 0):self._n]
+        self.flush()
+        return self.sink.read()[start:]
+
+    def to_pandas(self):
+        """ DataFrame whose columns share memory with the recorder. """
+        import pandas as pd
+
+        return pd.DataFrame({name: self[name] for name in self.columns}, copy=False)
+
+    def to_parquet(self, path, **kwargs):
+        """ Writes the history to Parquet (needs pyarrow or fastparquet). """
+        self.to_pandas().to_parquet(path, index=False, **kwargs)
+
+
+def _npy_header(dtype, rows):
+    """
+    .npy (version 1.0) header for rows records of dtype. The shape is padded to
+    a fixed width, so the header can be rewritten in place as the file grows.
+    """
+    header = f"{{'descr': {np.lib.format.dtype_to_descr(dtype)!r}, 'fortran_order': False, 'shape': ({rows:>20},), }}"
+    length = len(header) + 1 + (-(len(_NPY_MAGIC) + 2 + len(header) + 1) % 64)  # data starts 64-byte aligned
+    return _NPY_MAGIC + length.to_bytes(2, "little") + header.ljust(length - 1).encode("latin1") + b"\n"
+
+
+class NpyFileSink:
+    def __init__(self, path, dtype=STEP_DTYPE):
+        """
+        Streams rows to a .npy file. The header is rewritten after every
+        write, so the file is always a valid array that np.load(path,
+        mmap_mode="r") or read_history() can memory-map, even mid-run.
+        Pickling (checkpoints) keeps the path and row count; a restored sink
+        drops whatever was written after the checkpoint and appends from there.
+        """
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self._header_size = len(_npy_header(self.dtype, 0))
+        self._file = open(path, "wb")
+        self._file.write(_npy_header(self.dtype, 0))
+        self._file.flush()
+
+    def __getstate__(self):
+        if self._file is not None:
+            self._file.flush()
+        state = self.__dict__.copy()
+        state["_file"] = None
+        return state
+
+    def _reopen(self):
+        self._file = open(self.path, "r+b")
+        self._file.truncate(self._header_size + self.rows * self.dtype.itemsize)
+        self._file.seek(0, os.SEEK_END)
+
+    def write(self, rows):
+        if self._file is None:
+            self._reopen()
+        rows.astype(self.dtype, copy=False).tofile(self._file)
+        self.rows += len(rows)
+        self._file.seek(0)
+        self._file.write(_npy_header(self.dtype, self.rows))
+        self._file.seek(0, os.SEEK_END)
+        self._file.flush()
+
+    def read(self):
+        """ Every row written so far, memory-mapped. """
+        return read_history(self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class ParquetSink:
+    def __init__(self, path):
+        """
+        Streams rows to a Parquet dataset: a directory with one file per
+        flushed chunk (needs pyarrow), readable at any point with
+        read_history() or any Parquet reader. A sink restored from a
+        checkpoint removes the parts written after it before appending.
+        """
+        self.path = path
+        self.parts = 0
+        self._resumed = False
+        os.makedirs(path, exist_ok=True)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._resumed = True
+
+    def write(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._resumed:
+            for name in os.listdir(self.path):
+                if name.startswith("part-") and int(name[5:11]) >= self.parts:
+                    os.remove(os.path.join(self.path, name))
+            self._resumed = False
+        table = pa.table({name: rows[name] for name in rows.dtype.names})
+        pq.write_table(table, os.path.join(self.path, f"part-{self.parts:06d}.parquet"))
+        self.parts += 1
+
+    def read(self):
+        """ Every row written so far, as a DataFrame. """
+        return read_history(self.path)
+
+    def close(self):
+        pass
+
+
+def history_sink(path, dtype=STEP_DTYPE):
+    """ NpyFileSink for a .npy path, ParquetSink (a dataset directory) otherwise. """
+    if path.lower().endswith(".npy"):
+        return NpyFileSink(path, dtype)
+    return ParquetSink(path)
+
+
+def read_history(path, mmap=True):
+    """
+    Loads a history streamed by NpyFileSink or ParquetSink. A .npy file comes
+    back as a structured array, memory-mapped by default so multi-million-step
+    runs are not read into RAM; a Parquet dataset comes back as a DataFrame.
+    Both index by column name, e.g. read_history(path)["total_pnl"].
+    """
+    if path.lower().endswith(".npy"):
+        return np.load(path, mmap_mode="r" if mmap else None)
+    import pandas as pd
+
+    return pd.read_parquet(path, memory_map=mmap)
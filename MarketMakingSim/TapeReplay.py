@@ -0,0 +1,242 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from MarketMaker import as_makers, place_quotes_in_turn
+
+TAPE_COLUMNS = ("timestamp", "price", "size", "side", "bid", "ask", "bid_size", "ask_size")
+
+# Column names of the trading_bot fills table (QuestDB), exported to CSV / Parquet
+FILLS_COLUMNS = {"filled_avg_price": "price", "filled_qty": "size"}
+
+
+def read_tape(path, chunksize=100_000, columns=None):
+    """
+    Streams a trades / quotes tape from CSV (optionally compressed) or Parquet
+    as DataFrames of at most chunksize rows, so a tape of any size is read in
+    bounded memory. columns renames source columns to TAPE_COLUMNS, e.g.
+    FILLS_COLUMNS for the trading_bot fills export; other columns, apart from
+    symbol, are dropped.
+    """
+    columns = columns or {}
+    if path.lower().endswith((".parquet", ".pq")):
+        import pyarrow.parquet as pq
+
+        batches = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize))
+    else:
+        batches = pd.read_csv(path, chunksize=chunksize)
+    for chunk in batches:
+        chunk = chunk.rename(columns=columns)
+        yield chunk[[name for name in TAPE_COLUMNS + ("symbol",) if name in chunk.columns]]
+
+
+def _one_symbol(chunks, symbol=None):
+    """
+    Keeps one symbol's rows: symbol's, or those of the tape's only symbol if
+    symbol is None. A tape that turns out to hold several symbols without a
+    symbol to pick raises ValueError at the first chunk with a second one.
+    """
+    seen = None
+    for chunk in chunks:
+        if "symbol" not in chunk.columns:
+            if symbol is not None:
+                raise ValueError(f"cannot pick symbol {symbol!r}: the tape has no symbol column")
+        elif symbol is not None:
+            chunk = chunk[chunk["symbol"] == symbol]
+        else:
+            for name in chunk["symbol"].dropna().unique().tolist():
+                if seen is None:
+                    seen = name
+                elif name != seen:
+                    raise ValueError(f"the tape holds several symbols ({seen!r}, {name!r}); pass symbol= to pick one")
+        yield chunk
+
+
+def _column(chunk, name):
+    """ A numeric column as floats, all NaN if the tape does not have it. """
+    return chunk[name].to_numpy(dtype=float) if name in chunk.columns else np.full(len(chunk), np.nan)
+
+
+def _sizes(values, default):
+    """ Sizes rounded to whole units as a list, with default where the value is missing. """
+    return np.rint(np.where(np.isnan(values), default, values)).astype(np.int64).tolist()
+
+
+def _epoch_unit(value):
+    """ The unit of an epoch timestamp, guessed from its magnitude (a date after 1973 in s, ms, us or ns). """
+    for unit, limit in (("s", 1e11), ("ms", 1e14), ("us", 1e17)):
+        if abs(value) < limit:
+            return unit
+    return "ns"
+
+
+def _side_codes(sides):
+    """ 1 for buy, -1 for sell, 0 where the side is missing or unrecognised. """
+    text = sides.astype(str).str.lower()
+    buy = text.str.contains("buy") | (text == "b")
+    sell = text.str.contains("sell") | (text == "s")
+    return np.where(buy, 1, np.where(sell, -1, 0))
+
+
+class TapeReplay:
+    def __init__(self, order_book, market_maker=None, speed=None, record_every=1000, band=0.03,
+                 synthetic_half_spread=1, synthetic_touch=None, timestamp_unit=None):
+        """
+        Replays a historical tape into an OrderBook, so a MarketMaker can be
+        tested against real flow instead of the GBM.
+
+        The replay starts from an empty book: the levels already in it (such as
+        the investor orders a new book is seeded with) are cleared first.
+
+        A quote row replaces the tape's resting bid / ask (owner "tape") with
+        the quoted prices and sizes, after pruning any level at or through
+        them on the opposite side, so the book never crosses. A trade row is a market order of the
+        traded size: tape liquidity of that size is posted at the trade price
+        on the passive side, the order is executed against the book (hitting
+        the maker first if it quotes at or through the trade price), and any
+        tape liquidity left over is pulled. Trades with no side are classified
+        against the mid. For trade-only tapes the touch is synthesized
+        synthetic_half_spread ticks either side of each trade: by default
+        until the tape's first quote row, so the choice does not depend on
+        how the tape is chunked.
+
+        Parameters:
+        - order_book: the OrderBook to replay into
+        - market_maker: optional MarketMaker, or list of competing makers; they requote after
+          every row (in a rotating order) and are recorded
+        - speed: None replays as fast as possible; otherwise a multiple of tape time
+          (1.0 = real time, 60.0 = one tape minute per second); needs a timestamp column
+        - record_every: rows between market maker recorder rows
+        - band: levels further than this fraction from the tape price are pruned
+        - synthetic_half_spread: half spread in ticks of the touch synthesized from trades
+        - synthetic_touch: True / False to always / never synthesize the touch from trades;
+          None synthesizes it until the tape quotes
+        - timestamp_unit: unit ("s", "ms", "us", "ns") of numeric epoch timestamps; None guesses it
+          from the tape's first timestamp. Text timestamps are parsed as ISO 8601
+        """
+        self.order_book = order_book
+        self.market_maker = market_maker
+        self.makers = as_makers(market_maker) if market_maker is not None else ()
+        self.speed = speed
+        self.record_every = record_every
+        self.band = band
+        self.synthetic_half_spread = synthetic_half_spread
+        self.synthetic_touch = synthetic_touch
+        self.quoted = False  # Whether a quote row has been replayed yet
+        self.timestamp_unit = timestamp_unit
+        self.rows = 0  # Rows replayed so far, across replay calls
+        self.tape_agent = order_book.agent_id("tape")  # Agent ID owning the tape's liquidity
+        self.tape_bid_id = None  # Book IDs of the tape's resting touch
+        self.tape_ask_id = None
+        self._clock = None  # (first tape timestamp in ns, wall time it was replayed at)
+        order_book.prune_outside(0, -1)  # an empty band: drops every level
+
+    def _set_touch(self, bid_tick, ask_tick, bid_size, ask_size):
+        book = self.order_book
+        for order_id in (self.tape_bid_id, self.tape_ask_id):
+            if order_id is not None:
+                book.cancel_by_id(order_id)
+        # Levels the new touch would cross are stale: asks at or below the bid, bids at or above the ask
+        book.prune_outside(bid_tick + 1, sys.maxsize, "sell")
+        book.prune_outside(-sys.maxsize, ask_tick - 1, "buy")
+        self.tape_bid_id = book.add_limit_order_ticks(bid_tick, bid_size, "buy", owner=self.tape_agent)
+        self.tape_ask_id = book.add_limit_order_ticks(ask_tick, ask_size, "sell", owner=self.tape_agent)
+
+    def _trade(self, tick, size, side):
+        book = self.order_book
+        if side == 0:
+            side = 1 if book.ticks_to_price(tick) >= book.get_current_market_price() else -1
+        aggressor, passive = ("buy", "sell") if side > 0 else ("sell", "buy")
+        # The tape's own touch is stale if the trade printed through it
+        touch_id = self.tape_ask_id if side > 0 else self.tape_bid_id
+        touch = book.get_order(touch_id) if touch_id is not None else None
+        if touch is not None and (touch.tick < tick if side > 0 else touch.tick > tick):
+            book.cancel_by_id(touch_id)
+        order_id = book.add_limit_order_ticks(tick, size, passive, owner=self.tape_agent)
+        book.execute_market_order(size, aggressor)
+        book.cancel_by_id(order_id)  # no-op if the trade consumed all of it
+
+    def _timestamps(self, column):
+        """ A timestamp column as a list of epoch ns: numeric values are epoch times in timestamp_unit. """
+        if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            if self.timestamp_unit is None and len(column):
+                self.timestamp_unit = _epoch_unit(column.iloc[0])
+            stamps = pd.to_datetime(column, unit=self.timestamp_unit or "ns")
+        else:
+            stamps = pd.to_datetime(column, utc=True, format="ISO8601").dt.tz_convert(None)
+        return stamps.dt.as_unit("ns").to_numpy().view(np.int64).tolist()
+
+    def _wait(self, timestamp):
+        """ Sleeps until timestamp (ns) is due at the replay speed. """
+        if self._clock is None:
+            self._clock = (timestamp, time.perf_counter())
+        first, wall = self._clock
+        delay = wall + (timestamp - first) / 1e9 / self.speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def replay(self, source, chunksize=100_000, columns=None, symbol=None):
+        """
+        Replays a tape: a CSV / Parquet path (see read_tape), or a DataFrame or
+        iterable of DataFrames with TAPE_COLUMNS. A tape with a symbol column
+        holding several symbols needs symbol to pick the one to replay. Returns
+        a dict with the rows, trades and quotes replayed, the wall time and rows_per_sec.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            chunks = read_tape(os.fspath(source), chunksize, columns)
+        else:
+            chunks = [source] if isinstance(source, pd.DataFrame) else source
+        chunks = _one_symbol(chunks, symbol)
+        book, makers = self.order_book, self.makers
+        half = self.synthetic_half_spread
+        rows = trades = quotes = 0
+        start = time.perf_counter()
+
+        for chunk in chunks:
+            # Columns are converted once per chunk; the row loop only sees Python scalars
+            price, size, bid, ask = (_column(chunk, name) for name in ("price", "size", "bid", "ask"))
+            # Fractional sizes (filled_qty is a double) round to whole units; a trade that rounds to 0 is skipped
+            has_trade = ~np.isnan(price) & (np.rint(np.nan_to_num(size)) > 0)
+            has_quote = ~np.isnan(bid) & ~np.isnan(ask)
+            sides = _side_codes(chunk["side"]) if "side" in chunk.columns else np.zeros(len(chunk), dtype=int)
+            stamps = None
+            if self.speed:
+                if "timestamp" not in chunk.columns:
+                    raise ValueError("replaying at a speed needs a timestamp column")
+                stamps = self._timestamps(chunk["timestamp"])
+            ticks = [np.rint(np.nan_to_num(values) / book.tick_size).astype(np.int64).tolist()
+                     for values in (price, bid, ask)]
+
+            for i, (trade_tick, trade_size, side, bid_tick, ask_tick, bid_qty, ask_qty, trade, quote) in enumerate(zip(
+                    ticks[0], _sizes(size, 0), sides.tolist(), ticks[1], ticks[2],
+                    _sizes(_column(chunk, "bid_size"), 1), _sizes(_column(chunk, "ask_size"), 1),
+                    has_trade.tolist(), has_quote.tolist())):
+                if not (trade or quote):
+                    continue
+                if stamps is not None:
+                    self._wait(stamps[i])
+
+                if quote:
+                    self._set_touch(bid_tick, ask_tick, max(bid_qty, 1), max(ask_qty, 1))
+                    self.quoted = True
+                    quotes += 1
+                if trade:
+                    if self.synthetic_touch or (self.synthetic_touch is None and not self.quoted):
+                        self._set_touch(trade_tick - half, trade_tick + half, trade_size, trade_size)
+                    self._trade(trade_tick, trade_size, side)
+                    trades += 1
+
+                reference = trade_tick if trade else (bid_tick + ask_tick) // 2
+                book.prune_outside(*book.band_ticks(book.ticks_to_price(reference), self.band))
+                rows += 1
+                self.rows += 1
+                if makers:
+                    place_quotes_in_turn(makers, self.rows)
+                    if self.rows % self.record_every == 0:
+                        for maker in makers:
+                            maker.record_step(len(maker.recorder), book.get_current_market_price())
+
+        seconds = time.perf_counter() - start
+        return {"rows": rows, "trades": trades, "quotes": quotes, "seconds": seconds,
+                "rows_per_sec": rows / seconds if seconds else float("inf")}
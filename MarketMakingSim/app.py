@@ -1,11 +1,54 @@
+import os
+import tempfile
+from collections import OrderedDict
 import streamlit as st
-import numpy as np
-from GBM import GBMSimulator
-from OrderBook import OrderBook
-from MarketMaker import MarketMaker, fixed_spread_strategy
-from simulation_generator import run_simulation
+import pandas as pd
+from simulation_generator import build_simulation, iter_simulation
 from visualization import MarketMakerVisualizer
 
+MAX_CACHED_RUNS = 32
+STRATEGY_LABELS = {
+    "fixed_spread": "Fixed spread",
+    "inventory_skew": "Inventory-skewed spread",
+    "penny_jump": "Penny jump",
+}
+
+
+class _RunCache:
+    """ Least-recently-used store of finished runs, keyed by (parameters, seed). """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+@st.cache_resource
+def get_run_cache():
+    # Shared across reruns and sessions; the LRU bound keeps memory flat
+    return _RunCache(MAX_CACHED_RUNS)
+
+
+def render_animation(gbm_prices, total_pnl):
+    """ Renders the animated GIF and returns its bytes. """
+    visualizer = MarketMakerVisualizer(gbm_prices, total_pnl)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = visualizer.save_animation(os.path.join(tmp, "animation.gif"))  # Save as GIF
+        with open(path, "rb") as f:
+            return f.read()
+
+
 # Streamlit App Title
 st.title("Market-Making Simulator")
 
@@ -18,28 +61,54 @@ mu = st.sidebar.slider("Drift (μ)", min_value=-0.1, max_value=0.1, value=0.05,
 sigma = st.sidebar.slider("Volatility (σ)", min_value=0.01, max_value=0.5, value=0.15, step=0.01)
 spread = st.sidebar.slider("Market Maker Spread", min_value=0.01, max_value=1.0, value=0.10, step=0.01)
 size = st.sidebar.slider("Order Size", min_value=5, max_value=50, value=25, step=5)
+strategy = st.sidebar.selectbox("Quoting Strategy", list(STRATEGY_LABELS), format_func=STRATEGY_LABELS.get)
+strategy_params = {}
+if strategy == "inventory_skew":
+    strategy_params["skew"] = st.sidebar.slider("Inventory Skew (price per unit)", min_value=0.0, max_value=0.02,
+                                                value=0.002, step=0.001, format="%.3f")
+seed = int(st.sidebar.number_input("Random Seed", min_value=0, value=42, step=1))
+animate = st.sidebar.checkbox("Render animation (slower)", value=False)
 
 # Button to run simulation
 if st.sidebar.button("Run Simulation"):
-    st.subheader("Please wait while we simulate Market-Making...")
-    
-    # Initialize GBM simulator and order book
-    gbm = GBMSimulator(S0=initial_price, mu=mu, sigma=sigma, dt=1.0/num_steps)
-    order_book = OrderBook(initial_price=initial_price)
+    cache = get_run_cache()
+    key = (num_steps, initial_price, mu, sigma, spread, size, seed, strategy, tuple(sorted(strategy_params.items())))
+    result = cache.get(key)
 
-    # Initialize Market Maker
-    market_maker = MarketMaker(order_book, lambda ob, s: fixed_spread_strategy(ob, s, spread=spread), size=size)
+    st.subheader("Market Maker PnL Over Time")
+    st.caption("GBM Price")
+    price_chart = st.empty()
+    st.caption("Total PnL")
+    pnl_chart = st.empty()
 
-    # Run the simulation
-    gbm_prices, total_pnl = run_simulation(gbm, order_book, market_maker, num_steps)
+    if result is None:
+        # Initialize GBM simulator, order book and Market Maker
+        gbm, order_book, market_maker = build_simulation(initial_price, mu, sigma, num_steps, spread, size, seed=seed,
+                                                             strategy=strategy, strategy_params=strategy_params)
+        recorder = market_maker.recorder
 
+        # Run the simulation, redrawing the charts after every block of steps
+        progress = st.progress(0.0, text="Simulating Market-Making...")
+        for done in iter_simulation(gbm, order_book, market_maker, num_steps,
+                                    report_every=max(1, num_steps // 20)):
+            price_chart.line_chart(pd.DataFrame({"GBM Price": recorder["price"]}))
+            pnl_chart.line_chart(pd.DataFrame({"Total PnL": recorder["total_pnl"]}))
+            progress.progress(done / num_steps, text="Simulating Market-Making...")
+        progress.empty()
 
+        result = {
+            "gbm_prices": recorder["price"].copy(),
+            "total_pnl": recorder["total_pnl"].copy(),
+            "animation": None,
+        }
+        cache.put(key, result)
+    else:
+        price_chart.line_chart(pd.DataFrame({"GBM Price": result["gbm_prices"]}))
+        pnl_chart.line_chart(pd.DataFrame({"Total PnL": result["total_pnl"]}))
 
     # Display animated PnL visualization
-    st.subheader("Market Maker PnL Over Time")
-    visualizer = MarketMakerVisualizer(gbm_prices, total_pnl)
-    # visualizer.save_animation("animation.mp4")
-    # st.video("animation.mp4")   
-
-    visualizer.save_animation("animation.gif")  # Save as GIF
-    st.image("animation.gif")
+    if animate:
+        if result["animation"] is None:
+            with st.spinner("Rendering animation..."):
+                result["animation"] = render_animation(result["gbm_prices"], result["total_pnl"])
+        st.image(result["animation"])
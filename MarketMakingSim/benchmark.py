@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+from BufferedRNG import BufferedRNG
+from EventScheduler import EventDrivenSimulation
+from OrderBook import OrderBook
+from simulation_generator import build_simulation, run_simulation
+
+BENCH_SEED = 12345
+DEPTHS = (10, 100, 1000)
+SIM_STEPS = (100, 1000, 5000)
+ORDERS_PER_LEVEL = 4
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+
+def _deep_book(depth, seed=BENCH_SEED):
+    """ A book with `depth` levels per side around 100.00, ORDERS_PER_LEVEL orders of size 10 each. """
+    book = OrderBook(initial_price=100.0, rng=BufferedRNG(seed))
+    for tick in list(book._bid_ticks):
+        book.cancel_order_ticks(tick, "buy")
+    for tick in list(book._ask_ticks):
+        book.cancel_order_ticks(tick, "sell")
+    mid = book.price_to_ticks(100.0)
+    for i in range(depth):
+        book.add_limit_orders_ticks([mid - 1 - i] * ORDERS_PER_LEVEL, [10] * ORDERS_PER_LEVEL, "buy")
+        book.add_limit_orders_ticks([mid + 1 + i] * ORDERS_PER_LEVEL, [10] * ORDERS_PER_LEVEL, "sell")
+    book.update_mid_price()
+    return book
+
+
+def _best_of(run, repeat):
+    """ Calls run() repeat times; run returns (seconds, n_ops). Returns the fastest seconds per op. """
+    return min(seconds / n for seconds, n in (run() for _ in range(repeat)))
+
+
+def bench_add(depth, n=20000, repeat=3):
+    """ Limit orders added at random levels inside a book of the given depth. """
+    def run():
+        book = _deep_book(depth)
+        mid = book.price_to_ticks(100.0)
+        rng = np.random.default_rng(BENCH_SEED)
+        ticks = (mid - 1 - rng.integers(0, depth, n)).tolist()
+        add = book.add_limit_order_ticks
+        start = time.perf_counter()
+        for tick in ticks:
+            add(tick, 10, "buy")
+        return time.perf_counter() - start, n
+    return _best_of(run, repeat)
+
+
+def bench_cancel(depth, n=20000, repeat=3):
+    """ Orders cancelled by ID, in random order, from a book of the given depth. """
+    def run():
+        book = _deep_book(depth)
+        mid = book.price_to_ticks(100.0)
+        rng = np.random.default_rng(BENCH_SEED)
+        ids = list(book.add_limit_orders_ticks((mid - 1 - rng.integers(0, depth, n)).tolist(), [10] * n, "buy"))
+        rng.shuffle(ids)
+        cancel = book.cancel_by_id
+        start = time.perf_counter()
+        for order_id in ids:
+            cancel(order_id)
+        return time.perf_counter() - start, n
+    return _best_of(run, repeat)
+
+
+def bench_market_order(depth, n=5000, sweep_levels=3, repeat=3):
+    """
+    Market orders that each sweep sweep_levels levels of a book of the given
+    depth. The consumed levels are restored between orders, outside the timing,
+    so every order sees the same book.
+    """
+    size = sweep_levels * ORDERS_PER_LEVEL * 10 - 5  # last level is only partly filled
+
+    def run():
+        book = _deep_book(depth)
+        mid = book.price_to_ticks(100.0)
+        elapsed = 0.0
+        for i in range(n):
+            side, passive, sign = ("buy", "sell", 1) if i % 2 else ("sell", "buy", -1)
+            start = time.perf_counter()
+            book.execute_market_order(size, side)
+            elapsed += time.perf_counter() - start
+            for level in range(sweep_levels):
+                book.cancel_order_ticks(mid + sign * (1 + level), passive)
+                book.add_limit_orders_ticks([mid + sign * (1 + level)] * ORDERS_PER_LEVEL,
+                                            [10] * ORDERS_PER_LEVEL, passive)
+        return elapsed, n
+    return _best_of(run, repeat)
+
+
+def bench_place_quotes(n=20000, warmup_steps=50, repeat=3):
+    """
+    MarketMaker.place_quotes on a book warmed up by a short simulation run.
+    The maker's previous quotes are pulled between calls, outside the timing,
+    so every call quotes against the same investor touch instead of its own.
+    """
+    def run():
+        gbm, book, market_maker = build_simulation(num_steps=warmup_steps, seed=BENCH_SEED)
+        run_simulation(gbm, book, market_maker, warmup_steps)
+        place_quotes = market_maker.place_quotes
+        elapsed = 0.0
+        for _ in range(n):
+            for order_id in (market_maker.bid_order_id, market_maker.ask_order_id):
+                if order_id is not None:
+                    book.cancel_by_id(order_id)
+            market_maker.bid_order_id = market_maker.ask_order_id = None
+            start = time.perf_counter()
+            place_quotes()
+            elapsed += time.perf_counter() - start
+        if market_maker.bid_order_id is None:
+            raise RuntimeError("place_quotes did not quote; the warmed-up book has an empty side")
+        return elapsed, n
+    return _best_of(run, repeat)
+
+
+def bench_simulation(num_steps, repeat=3):
+    """ End-to-end run_simulation, including the book's initial setup. """
+    def run():
+        gbm, book, market_maker = build_simulation(num_steps=num_steps, seed=BENCH_SEED)
+        start = time.perf_counter()
+        run_simulation(gbm, book, market_maker, num_steps)
+        return time.perf_counter() - start, num_steps
+    return _best_of(run, repeat)
+
+
+def bench_event_simulation(num_steps, repeat=3):
+    """ EventDrivenSimulation over num_steps steps' worth of time. Returns seconds per event. """
+    def run():
+        gbm, book, market_maker = build_simulation(num_steps=num_steps, seed=BENCH_SEED)
+        stats = EventDrivenSimulation(gbm, book, market_maker).run(1.0)
+        return stats["seconds"], stats["events"]
+    return _best_of(run, repeat)
+
+
+def run_benchmarks(quick=False):
+    """
+    Runs the whole suite and returns {name: {"value", "unit", "higher_is_better"}}.
+    quick shrinks the workloads (and skips the largest sizes) for a fast smoke run.
+    """
+    scale = 10 if quick else 1
+    depths = DEPTHS[:-1] if quick else DEPTHS
+    sim_steps = SIM_STEPS[:-1] if quick else SIM_STEPS
+    results = {}
+
+    def ops(name, seconds_per_op):
+        results[name] = {"value": 1.0 / seconds_per_op, "unit": "ops/s", "higher_is_better": True}
+
+    for depth in depths:
+        ops(f"add_limit_order/depth={depth}", bench_add(depth, n=20000 // scale))
+        ops(f"cancel_by_id/depth={depth}", bench_cancel(depth, n=20000 // scale))
+        ops(f"execute_market_order/depth={depth}", bench_market_order(depth, n=5000 // scale))
+    results["place_quotes/latency"] = {"value": bench_place_quotes(n=20000 // scale) * 1e6, "unit": "us",
+                                       "higher_is_better": False}
+    for num_steps in sim_steps:
+        results[f"run_simulation/steps={num_steps}"] = {"value": 1.0 / bench_simulation(num_steps),
+                                                        "unit": "steps/s", "higher_is_better": True}
+    event_steps = 1000 // scale
+    results[f"event_simulation/steps={event_steps}"] = {"value": 1.0 / bench_event_simulation(event_steps),
+                                                        "unit": "events/s", "higher_is_better": True}
+    return results
+
+
+def compare(results, baseline, tolerance=0.20):
+    """
+    Compares results to a baseline's results. Returns a list of
+    (name, baseline_value, value, relative_change, regressed) where
+    relative_change > 0 always means faster, and regressed flags slowdowns
+    beyond tolerance. Benchmarks missing from either side are skipped.
+    """
+    rows = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["value"], result["value"]
+        change = new / old - 1 if result["higher_is_better"] else old / new - 1
+        rows.append((name, old, new, change, change < -tolerance))
+    return rows
+
+
+def _metadata():
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "seed": BENCH_SEED,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Order book and simulation loop benchmarks")
+    parser.add_argument("--quick", action="store_true", help="smaller workloads for a fast smoke run")
+    parser.add_argument("--output", help="write this run's results as JSON to this path")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with this run")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="allowed slowdown before failing")
+    args = parser.parse_args(argv)
+
+    report = {"meta": _metadata(), "results": run_benchmarks(quick=args.quick)}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    rows = compare(report["results"], baseline, args.tolerance) if baseline else []
+    by_name = {row[0]: row for row in rows}
+    for name, result in report["results"].items():
+        line = f"{name:<36} {result['value']:>14,.1f} {result['unit']:<8}"
+        if name in by_name:
+            _, old, _, change, regressed = by_name[name]
+            line += f" baseline {old:>12,.1f} {change:+7.1%}" + ("  REGRESSION" if regressed else "")
+        print(line)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    return 1 if any(row[4] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import os
+import pickle
+import zlib
+import numpy as np
+from BufferedRNG import BufferedRNG
+from MarketMaker import as_makers
+
+CHECKPOINT_VERSION = 2
+
+
+def snapshot(gbm, order_book, market_maker, level=1):
+    """
+    Serializes the full simulator state (GBM and its RNG, order book and the
+    investor flow's RNG, market maker and its recorded history) to compressed
+    bytes. level is the zlib level; the default favours speed over size.
+    The book's journal holds open sinks, so it is left out and reattached on restore.
+    """
+    journal, order_book.journal = order_book.journal, None
+    try:
+        state = {"version": CHECKPOINT_VERSION, "steps": len(as_makers(market_maker)[0].recorder),
+                 "simulation": (gbm, order_book, market_maker)}
+        return zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), level)
+    finally:
+        order_book.journal = journal
+
+
+def restore(blob, journal=None):
+    """ Rebuilds (gbm, order_book, market_maker) from snapshot bytes, attaching journal to the book. """
+    state = pickle.loads(zlib.decompress(blob))
+    if state["version"] != CHECKPOINT_VERSION:
+        raise ValueError(f"checkpoint version {state['version']} is not supported (expected {CHECKPOINT_VERSION})")
+    gbm, order_book, market_maker = state["simulation"]
+    order_book.journal = journal
+    return gbm, order_book, market_maker
+
+
+def save_checkpoint(path, gbm, order_book, market_maker, level=1):
+    """ Writes a snapshot to path, replacing any previous checkpoint atomically. """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(snapshot(gbm, order_book, market_maker, level))
+    os.replace(tmp, path)  # an interrupted save leaves the last good checkpoint in place
+
+
+def load_checkpoint(path, journal=None):
+    """ Reads a checkpoint written by save_checkpoint. Returns (gbm, order_book, market_maker). """
+    with open(path, "rb") as f:
+        return restore(f.read(), journal)
+
+
+def fork(gbm, order_book, market_maker, seed=None):
+    """
+    Independent copy of a simulation, to branch what-if scenarios off a shared
+    warm-up. With seed=None the copy continues exactly as the original would;
+    with a seed, its GBM and investor flow get fresh streams spawned from it
+    (as in build_simulation), so branches with different seeds diverge.
+    The copy has no journal, and keeps its history in memory rather than
+    streaming to the original's output files (set recorder.sink to stream it).
+    """
+    gbm, order_book, market_maker = restore(snapshot(gbm, order_book, market_maker, level=0))
+    for maker in as_makers(market_maker):
+        maker.recorder.sink = maker.fills.sink = None
+    if seed is not None:
+        gbm_seed, book_seed = np.random.SeedSequence(seed).spawn(2)
+        gbm.rng = np.random.default_rng(gbm_seed)
+        order_book.rng = BufferedRNG(book_seed, order_book.rng.block_size)
+    return gbm, order_book, market_maker
@@ -0,0 +1,124 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from BatchSimulator import BatchSimulator, batch_runs
+from simulation_generator import build_simulation, run_simulation
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def simulate_path(seed, params):
+    """
+    Runs one seeded simulation and returns its per-step paths.
+
+    Parameters:
+    - seed: integer seed for this run
+    - params: keyword arguments for build_simulation (num_steps, 50 by default as there, is also the run length)
+    """
+    gbm, order_book, market_maker = build_simulation(seed=seed, **params)
+    gbm_prices, total_pnl = run_simulation(gbm, order_book, market_maker, params.get("num_steps", 50))
+    return {
+        "seed": seed,
+        "prices": np.asarray(gbm_prices),
+        "pnl": np.asarray(total_pnl, dtype=float),
+        "inventory": np.asarray(market_maker.inventory_hist),
+    }
+
+
+def _simulate_batch(seeds, params):
+    return [simulate_path(seed, params) for seed in seeds]
+
+
+def path_stats(run):
+    """ Final PnL, max drawdown, Sharpe and inventory statistics for a single run. """
+    pnl = run["pnl"]
+    inventory = run["inventory"]
+    drawdown = np.maximum.accumulate(pnl) - pnl
+    step_pnl = np.diff(pnl, prepend=0.0)
+    std = step_pnl.std()
+    # The GBM spans one time unit, so scaling by sqrt(steps) gives a per-unit Sharpe
+    sharpe = step_pnl.mean() / std * np.sqrt(len(pnl)) if std > 0 else 0.0
+    return {
+        "seed": run["seed"],
+        "final_pnl": pnl[-1],
+        "max_drawdown": drawdown.max(),
+        "sharpe": sharpe,
+        "final_inventory": inventory[-1],
+        "max_abs_inventory": np.abs(inventory).max(),
+    }
+
+
+def iter_ensemble(n_sims, seed=None, processes=None, batch_size=None, **params):
+    """
+    Runs n_sims independent simulations across a process pool and yields
+    each run's result dict as soon as its batch finishes.
+
+    Per-run seeds are drawn from one SeedSequence and each run spawns its own
+    RNG streams from its seed, so the set of runs is reproducible for a given
+    seed regardless of the number of processes.
+    Runs are sent to workers in batches to amortize the pickling overhead.
+    """
+    processes = processes or os.cpu_count()
+    children = np.random.SeedSequence(seed).spawn(n_sims)
+    seeds = [int(child.generate_state(1)[0]) for child in children]
+    batch_size = batch_size or max(1, n_sims // (processes * 4))
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_simulate_batch, seeds[i:i + batch_size], params)
+                   for i in range(0, n_sims, batch_size)]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def summarize_ensemble(stats):
+    """ Aggregates a list of path_stats dicts into distribution statistics. """
+    summary = {"n_sims": len(stats)}
+    for key in ("final_pnl", "max_drawdown", "sharpe", "final_inventory", "max_abs_inventory"):
+        values = np.array([s[key] for s in stats], dtype=float)
+        summary[key] = {
+            "mean": values.mean(),
+            "std": values.std(),
+            "quantiles": dict(zip(QUANTILES, np.quantile(values, QUANTILES))),
+        }
+    return summary
+
+
+def run_ensemble(n_sims, seed=None, processes=None, keep_paths=False, **params):
+    """
+    Runs an ensemble and returns (summary, per-run stats, paths), with runs
+    in completion order. Paths are only kept when keep_paths is set, so
+    large ensembles stream through without holding every path in memory.
+    """
+    stats = []
+    paths = []
+    for run in iter_ensemble(n_sims, seed=seed, processes=processes, **params):
+        stats.append(path_stats(run))
+        if keep_paths:
+            paths.append(run)
+    return summarize_ensemble(stats), stats, paths
+
+
+def run_batch_ensemble(n_sims, seed=None, keep_paths=False, **params):
+    """
+    run_ensemble on the lockstep BatchSimulator: all n_sims books are stepped
+    together in one process. Same statistics as the per-path runs (PnL is
+    marked every step rather than at each fill), at a fraction of the cost.
+    Returns (summary, per-run stats, paths) with books in order.
+    """
+    simulator = BatchSimulator(n_sims, seed=seed, **params)
+    runs = batch_runs(simulator.run(params.get("num_steps", 50)))
+    stats = [path_stats(run) for run in runs]
+    return summarize_ensemble(stats), stats, runs if keep_paths else []
+
+
+if __name__ == "__main__":
+    import time
+
+    start = time.perf_counter()
+    summary, _, _ = run_ensemble(200, seed=42, num_steps=250)
+    elapsed = time.perf_counter() - start
+    print(f"{summary['n_sims']} runs in {elapsed:.2f}s")
+    for key, value in summary.items():
+        if key != "n_sims":
+            quantiles = ", ".join(f"q{int(q * 100)}={v:.2f}" for q, v in value["quantiles"].items())
+            print(f"{key:<18} mean={value['mean']:.2f} std={value['std']:.2f} {quantiles}")
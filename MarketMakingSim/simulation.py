@@ -1,7 +1,13 @@
 from OrderBook import OrderBook
+from functools import partial
 from MarketMaker import MarketMaker, fixed_spread_strategy
+from SimulationRecorder import SimulationRecorder, history_sink
 from GBM import GBMSimulator
+from BufferedRNG import BufferedRNG
+from OrderFlow import OrderFlow
+from EventJournal import EventJournal, PrintSink, TRADES
 import numpy as np
+import itertools
 import time
 import matplotlib.pyplot as plt
 from visualization import MarketMakerVisualizer
@@ -12,105 +18,64 @@ INITIAL_PRICE = 100.0
 MU = 0.05
 SIGMA = 0.15
 DT = 1.0/NUM_STEPS
+VERBOSE = False  # print per-step state and the market order / fill tape
+SEED = None  # set an int for a reproducible run
+OUTPUT = None  # e.g. "history.npy": stream step records to disk in constant memory instead of keeping them
 
 # --- Initialize components ---
-gbm = GBMSimulator(S0=INITIAL_PRICE, mu=MU, sigma=SIGMA, dt=DT)
-order_book = OrderBook(initial_price=INITIAL_PRICE)
-market_maker = MarketMaker(order_book, lambda ob, s: fixed_spread_strategy(ob, s, spread=0.10), size=30)
-
-
-gbm_prices = []
-realized_pnls = []
-unrealized_pnls = []
-total_pnls = []
+gbm_seed, book_seed = np.random.SeedSequence(SEED).spawn(2)
+rng = BufferedRNG(book_seed)
+gbm = GBMSimulator(S0=INITIAL_PRICE, mu=MU, sigma=SIGMA, dt=DT, rng=np.random.default_rng(gbm_seed),
+                   keep_history=not OUTPUT)
+journal = EventJournal([PrintSink()], verbosity=TRADES, batch_size=1) if VERBOSE else None
+order_book = OrderBook(initial_price=INITIAL_PRICE, journal=journal, rng=rng)
+order_flow = OrderFlow(rng)
+recorder = SimulationRecorder(sink=history_sink(OUTPUT)) if OUTPUT else None
+market_maker = MarketMaker(order_book, partial(fixed_spread_strategy, spread=0.10), size=30, recorder=recorder)
 
 
 # --- Simulation loop ---
-for t in range(NUM_STEPS):
-    print(f"\n--- Time Step {t} ---")
-
-    # 1. Advance GBM price
-    if t != 0:
-        true_price = gbm.step()
+# 1. GBM path: the initial price, then NUM_STEPS - 1 pre-generated steps
+prices = itertools.chain([INITIAL_PRICE], gbm.iter_prices(NUM_STEPS - 1))
+for t, true_price in enumerate(prices):
+    if VERBOSE:
+        journal.step = t
+        print(f"\n--- Time Step {t} ---")
         print(f"Current GBM price: {true_price}")
-    else:
-        print(f"Current GBM price: {INITIAL_PRICE}")
-        true_price = INITIAL_PRICE
 
     # 2. Cancel outdated limit orders (e.g., far from GBM)
-    to_cancel = []
-    for price in list(order_book.bids.keys()):
-        if abs(price - true_price) / true_price > 0.03:
-            to_cancel.append((price, "buy"))
-        if price >= true_price:  # Bids cannot be above the true price
-            to_cancel.append((price, "buy"))
-    for price in list(order_book.asks.keys()):
-        if abs(price - true_price) / true_price > 0.03:
-            to_cancel.append((price, "sell"))
-        if price <= true_price:  # Asks cannot be below the true price
-            to_cancel.append((price, "sell"))
-    for price, side in to_cancel:
-        order_book.cancel_order(price, side)
-
-    # 3. Add new random investor limit orders (near GBM)
-    num_bids = np.random.randint(10, 20)
-    for _ in range(num_bids):
-        price = round(np.random.normal(loc=true_price*.99, scale=0.05), 2)
-        size = np.random.randint(5, 20)
-        side = "buy"
-
-        # 20% chance the investor places a more aggressive bid
-        if np.random.rand() < 0.20 and order_book.bids:
-            price = round(max(order_book.bids.keys()) + 0.01, 2)  # Outbids best bid
-
-        # Ensure no crossed market
-        if order_book.asks and price >= min(order_book.asks.keys()):
-            continue  # Skip this bid if it's too high
-
-        order_book.add_limit_order(price, size, side)
-
-    # Ensure 5-10 sell limit orders
-    num_asks = np.random.randint(10, 20)
-    for _ in range(num_asks):
-        price = round(np.random.normal(loc=true_price*1.01, scale=0.05), 2)
-        size = np.random.randint(5, 20)
-        side = "sell"
-
-        # 20% chance the investor places a more aggressive ask
-        if np.random.rand() < 0.20 and order_book.asks:
-            price = round(min(order_book.asks.keys()) - 0.01, 2)  # Undercuts best ask
-
-        # Ensure no crossed market
-        if order_book.bids and price <= max(order_book.bids.keys()):
-            continue  # Skip this ask if it's too low
+    low, high = order_book.band_ticks(true_price, 0.03)
+    true_tick = order_book.price_to_ticks(true_price)
+    below = true_tick if order_book.ticks_to_price(true_tick) < true_price else true_tick - 1
+    above = true_tick if order_book.ticks_to_price(true_tick) > true_price else true_tick + 1
+    order_book.prune_outside(low, min(high, below), "buy")  # Bids cannot be at or above the true price
+    order_book.prune_outside(max(low, above), high, "sell")  # Asks cannot be at or below the true price
 
-        order_book.add_limit_order(price, size, side)
+    # 3. Add new random investor limit orders (near GBM), resolved against the book in one shot
+    order_flow.submit(order_book, true_price)
 
     market_maker.place_quotes()
 
     # order_book.display_book()
 
     # 4. Execute some market orders
-    for _ in range(np.random.randint(1, 6)):
-        size = np.random.randint(5, 15)
-        side = np.random.choice(["buy", "sell"])
-        order_book.execute_market_order(size, side, market_maker=market_maker)
+    num_market = rng.integers(1, 6)
+    market_sizes = rng.integers(5, 15, num_market)
+    market_buys = rng.random(num_market) < 0.5
+    for size, buy in zip(market_sizes.tolist(), market_buys.tolist()):
+        order_book.execute_market_order(size, "buy" if buy else "sell")
 
-    market_maker.total_pnl_hist.append(round(market_maker.total_pnl,2))
-    market_maker.realized_pnl_hist.append(round(market_maker.realized_pnl,2))
-    market_maker.unrealized_pnl_hist.append(round(market_maker.unrealized_pnl,2))
+    market_maker.record_step(t, true_price)
 
 
     # 5. Show current order book
     # order_book.display_book()
-    print(f"✅ Market Maker realized PnL: {market_maker.realized_pnl:.2f}, total (unrealized + realized) PnL: {market_maker.total_pnl:.2f}, Inventory: {market_maker.inventory}")
-    gbm_prices.append(true_price)
-    realized_pnls.append(market_maker.realized_pnl)
-    unrealized_pnls.append(market_maker.unrealized_pnl)
-    total_pnls.append(market_maker.total_pnl)
+    if VERBOSE:
+        print(f"✅ Market Maker realized PnL: {market_maker.realized_pnl:.2f}, total (unrealized + realized) PnL: {market_maker.total_pnl:.2f}, Inventory: {market_maker.inventory}")
 
 
     # time.sleep(1)
 
-visualizer = MarketMakerVisualizer(gbm_prices, total_pnls)
+history = market_maker.recorder.history()  # memory-mapped from OUTPUT when streaming
+visualizer = MarketMakerVisualizer(history["price"], history["total_pnl"])
 plt.show()
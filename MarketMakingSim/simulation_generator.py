@@ -1,82 +1,171 @@
+import os
 import numpy as np
-
-
-def run_simulation(gbm, order_book, market_maker, num_steps):
-    gbm_prices = []
-    realized_pnl = []
-    unrealized_pnl = []
-    total_pnl = []
-
-    for _ in range(num_steps):
-        # 1️⃣ Update GBM Price
-        if _ == 0:
-            true_price = order_book.initial_price
-
-
-        true_price = gbm.step()
-        gbm_prices.append(true_price)
-
-        # 2️⃣ Cancel outdated limit orders
-        to_cancel = []
-        for price in list(order_book.bids.keys()):
-            if abs(price - true_price) / true_price > 0.03:
-                to_cancel.append((price, "buy"))
-        for price in list(order_book.asks.keys()):
-            if abs(price - true_price) / true_price > 0.03:
-                to_cancel.append((price, "sell"))
-        for price, side in to_cancel:
-            order_book.cancel_order(price, side)
-
-        # 3. Add new random investor limit orders (near GBM)
-        num_bids = np.random.randint(10, 20)
-        for _ in range(num_bids):
-            price = round(np.random.normal(loc=true_price*.99, scale=0.05), 2)
-            size = np.random.randint(5, 20)
-            side = "buy"
-
-            # 20% chance the investor places a more aggressive bid
-            if np.random.rand() < 0.20 and order_book.bids:
-                price = round(max(order_book.bids.keys()) + 0.01, 2)  # Outbids best bid
-
-            # Ensure no crossed market
-            if order_book.asks and price >= min(order_book.asks.keys()):
-                continue  # Skip this bid if it's too high
-
-            order_book.add_limit_order(price, size, side)
-
-        # Ensure 5-10 sell limit orders
-        num_asks = np.random.randint(10, 20)
-        for _ in range(num_asks):
-            price = round(np.random.normal(loc=true_price*1.01, scale=0.05), 2)
-            size = np.random.randint(5, 20)
-            side = "sell"
-
-            # 20% chance the investor places a more aggressive ask
-            if np.random.rand() < 0.20 and order_book.asks:
-                price = round(min(order_book.asks.keys()) - 0.01, 2)  # Undercuts best ask
-
-            # Ensure no crossed market
-            if order_book.bids and price <= max(order_book.bids.keys()):
-                continue  # Skip this ask if it's too low
-
-            order_book.add_limit_order(price, size, side)
-
-        # 4️⃣ Market Maker places quotes
-        market_maker.place_quotes()
+from BufferedRNG import BufferedRNG
+from checkpoint import save_checkpoint
+from GBM import GBMSimulator
+from OrderBook import OrderBook
+from OrderFlow import OrderFlow
+from MarketMaker import MarketMaker, as_makers, make_strategy, place_quotes_in_turn
+from SimulationRecorder import SimulationRecorder, FILL_DTYPE, history_sink
+
+
+def build_simulation(initial_price=100.0, mu=0.05, sigma=0.15, num_steps=50, spread=0.10, size=25, seed=None,
+                     strategy="fixed_spread", strategy_params=None, output=None):
+    """
+    Wires up a GBM, order book and market maker the way the app does, with
+    the GBM spanning one time unit over num_steps steps. The GBM and the book
+    get independent RNG streams spawned from one SeedSequence, so a given
+    seed reproduces the run exactly.
+
+    strategy is a name from MarketMaker.STRATEGIES, bound to spread and
+    strategy_params, or a ready-made strategy callable. A list of strategies
+    builds that many competing makers in the one book instead, named
+    market_maker_0, market_maker_1, ..., each with its own recorders, and
+    market_maker is then the list of them.
+
+    output streams the history to disk in constant memory instead of keeping
+    it: step records go to output (a .npy file, or a Parquet dataset
+    directory for any other path) and fill records to a ".fills" sibling
+    (run.npy -> run.fills.npy). Competing makers each get their own files,
+    named after them (run.market_maker_0.npy). Read them back with read_history.
+    Returns (gbm, order_book, market_maker).
+    """
+    gbm_seed, book_seed = np.random.SeedSequence(seed).spawn(2)
+    # The recorders hold the prices, so the GBM keeps no history of its own
+    gbm = GBMSimulator(S0=initial_price, mu=mu, sigma=sigma, dt=1.0/num_steps, rng=np.random.default_rng(gbm_seed),
+                       keep_history=False)
+    order_book = OrderBook(initial_price=initial_price, rng=BufferedRNG(book_seed))
+    competing = isinstance(strategy, (list, tuple))
+    strategies = strategy if competing else [strategy]
+    makers = []
+    for i, maker_strategy in enumerate(strategies):
+        name = f"market_maker_{i}" if competing else "market_maker"
+        if isinstance(maker_strategy, str):
+            maker_strategy = make_strategy(maker_strategy, spread=spread, **(strategy_params or {}))
+        recorder = fills = None
+        if output is not None:
+            root, ext = os.path.splitext(output)
+            root = f"{root}.{name}" if competing else root
+            recorder = SimulationRecorder(sink=history_sink(root + ext))
+            fills = SimulationRecorder(dtype=FILL_DTYPE, sink=history_sink(root + ".fills" + ext, FILL_DTYPE))
+        makers.append(MarketMaker(order_book, maker_strategy, size=size, recorder=recorder, fills=fills, name=name))
+    market_maker = makers if competing else makers[0]
+    return gbm, order_book, market_maker
+
+
+def run_simulation(gbm, order_book, market_maker, num_steps, chunk_size=1024, order_flow=None,
+                   checkpoint_path=None, checkpoint_every=10_000, profiler=None):
+    """
+    Runs num_steps steps, recording each one in market_maker.recorder.
+    Returns (gbm_prices, total_pnl) for the steps of this run as views onto
+    the recorder's columns, or onto the memory-mapped output when the
+    recorder streams to a sink (see build_simulation). Step numbers continue
+    from whatever the recorder already holds, so calling this again extends
+    the same run.
+
+    market_maker may also be a list of competing makers in the one book;
+    each records every step, and total_pnl is then a list with one array per maker.
+
+    order_flow is the investor limit-order model; by default an OrderFlow
+    with the standard parameters drawing from the book's RNG stream.
+
+    With a checkpoint_path, the full state is saved there every
+    checkpoint_every steps (rounded down to a whole number of chunks) and at
+    the end. After an interruption, checkpoint.load_checkpoint and a run of
+    the remaining steps continue exactly where the last checkpoint left off.
+
+    profiler is an optional PhaseProfiler that times each phase of the loop.
+    """
+    makers = as_makers(market_maker)
+    recorder = makers[0].recorder
+    start = len(recorder)
+    # Checkpointed runs go in whole-chunk segments, so the GBM is never part way
+    # through a pre-generated chunk when saved and prices match an unbroken run
+    segment = max(checkpoint_every // chunk_size, 1) * chunk_size if checkpoint_path else max(num_steps, 1)
+    while len(recorder) - start < num_steps:
+        steps = min(segment, num_steps - (len(recorder) - start))
+        for _ in iter_simulation(gbm, order_book, market_maker, steps, chunk_size, order_flow, report_every=steps,
+                                 profiler=profiler):
+            pass
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, gbm, order_book, market_maker)
+    for maker in makers:
+        maker.fills.flush()
+    histories = [maker.recorder.history(start) for maker in makers]
+    total_pnl = [np.asarray(history["total_pnl"]) for history in histories]
+    return np.asarray(histories[0]["price"]), total_pnl[0] if isinstance(market_maker, MarketMaker) else total_pnl
+
+
+def iter_simulation(gbm, order_book, market_maker, num_steps, chunk_size=1024, order_flow=None,
+                    report_every=100, profiler=None):
+    """
+    Generator form of run_simulation: runs the same loop but yields the
+    number of rows in market_maker.recorder after every report_every steps
+    (and once at the end), so callers can show partial results as they come.
+    The profiler, if any, is paused while the caller holds control.
+    """
+    makers = as_makers(market_maker)
+    recorder = makers[0].recorder
+    journal = order_book.journal
+    rng = order_book.rng  # the investor flow shares the book's stream
+    if order_flow is None:
+        order_flow = OrderFlow(rng)
+    start = len(recorder)
+    if profiler is not None:
+        profiler.start()
+
+    # 1️⃣ GBM prices are pre-generated in vectorized chunks
+    for step, true_price in enumerate(gbm.iter_prices(num_steps, chunk_size), start):
+        if profiler is not None:
+            profiler.lap("gbm")
+        if journal is not None:
+            journal.step = step
+
+        # 2️⃣ Cancel outdated limit orders (more than 3% from the GBM price)
+        order_book.prune_outside(*order_book.band_ticks(true_price, 0.03))
+        if profiler is not None:
+            profiler.lap("cancel")
+
+        # 3. Add new random investor limit orders (near GBM), resolved against the book in one shot
+        order_flow.submit(order_book, true_price)
+        if profiler is not None:
+            profiler.lap("limit_orders")
+
+        # 4️⃣ Market makers place quotes, starting from a different maker each step so none always gets queue priority
+        place_quotes_in_turn(makers, step)
+        if profiler is not None:
+            profiler.lap("quotes")
 
         # 5️⃣ Execute market orders
-        for _ in range(np.random.randint(1, 6)):
-            size = np.random.randint(5, 15)
-            side = np.random.choice(["buy", "sell"])
-            order_book.execute_market_order(size, side, market_maker = market_maker)
-
-        market_maker.total_pnl_hist.append(round(market_maker.total_pnl,2))
-        market_maker.realized_pnl_hist.append(round(market_maker.realized_pnl,2))
-        market_maker.unrealized_pnl_hist.append(round(market_maker.unrealized_pnl,2))
-
-        # 6️⃣ Track PnL
-        realized_pnl.append(market_maker.realized_pnl)
-        unrealized_pnl.append(market_maker.unrealized_pnl)
-        total_pnl.append(market_maker.total_pnl)
-
-    return gbm_prices, total_pnl
+        num_market = rng.integers(1, 6)
+        market_sizes = rng.integers(5, 15, num_market)
+        market_buys = rng.random(num_market) < 0.5
+        for size, buy in zip(market_sizes.tolist(), market_buys.tolist()):
+            order_book.execute_market_order(size, "buy" if buy else "sell")
+        if profiler is not None:
+            profiler.lap("market_orders")
+
+        # 6️⃣ Track PnL, one recorder row per maker
+        for maker in makers:
+            maker.record_step(step, true_price)
+
+        if (step + 1 - start) % report_every == 0:
+            if journal is not None:
+                journal.flush()
+            if profiler is not None:
+                profiler.lap("record")
+                profiler.end_step()
+                profiler.stop()
+            yield len(recorder)
+            if profiler is not None:
+                profiler.start()
+        elif profiler is not None:
+            profiler.lap("record")
+            profiler.end_step()
+
+    if journal is not None:
+        journal.flush()
+    if profiler is not None:
+        profiler.stop()
+    if (len(recorder) - start) % report_every:
+        yield len(recorder)
@@ -0,0 +1,157 @@
+import functools
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import matplotlib.pyplot as plt
+import numpy as np
+from ensemble import path_stats, simulate_path
+
+METRICS = ("mean_pnl", "std_pnl", "mean_drawdown", "mean_sharpe", "mean_abs_inventory")
+
+# Sources whose code decides a cell's results; editing any of them invalidates the cache
+MODEL_SOURCES = ("BufferedRNG.py", "GBM.py", "OrderBook.py", "OrderFlow.py", "MarketMaker.py",
+                 "SimulationRecorder.py", "EventJournal.py", "simulation_generator.py", "ensemble.py", "sweep.py")
+
+
+@functools.lru_cache(maxsize=None)
+def model_version():
+    """ Hash of MODEL_SOURCES, part of every cache key so a simulator change never serves stale cells. """
+    digest = hashlib.sha1()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in MODEL_SOURCES:
+        with open(os.path.join(here, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _cell_key(params, seeds, version):
+    blob = json.dumps({"params": params, "seeds": seeds, "version": version}, sort_keys=True)
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+def run_cell(params, seeds):
+    """ Runs one grid cell over every seed and reduces the runs to the METRICS. """
+    stats = [path_stats(simulate_path(seed, params)) for seed in seeds]
+    final_pnl = np.array([s["final_pnl"] for s in stats])
+    return {
+        "mean_pnl": float(final_pnl.mean()),
+        "std_pnl": float(final_pnl.std()),
+        "mean_drawdown": float(np.mean([s["max_drawdown"] for s in stats])),
+        "mean_sharpe": float(np.mean([s["sharpe"] for s in stats])),
+        "mean_abs_inventory": float(np.mean([abs(s["final_inventory"]) for s in stats])),
+    }
+
+
+def _run_cell_cached(params, seeds, cache_dir, version):
+    path = os.path.join(cache_dir, _cell_key(params, seeds, version) + ".json") if cache_dir else None
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    result = run_cell(params, seeds)
+    if path:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp, path)  # atomic, so a crashed worker never leaves half a file
+    return result
+
+
+def run_sweep(spreads, sizes, sigmas=(0.15,), mus=(0.05,), n_seeds=8, seed=0, num_steps=250,
+              initial_price=100.0, strategy="fixed_spread", strategy_params=None, processes=None,
+              cache_dir=".sweep_cache"):
+    """
+    Runs n_seeds seeded simulations for every (spread, size, sigma, mu) cell
+    across a process pool. Every cell uses the same seeds (common random
+    numbers), so differences between cells come from the parameters rather
+    than the noise. strategy / strategy_params pick the quoting strategy by
+    name, as in build_simulation. Finished cells are cached on disk under cache_dir, so an
+    interrupted or extended sweep only runs the cells it has not seen. Cache keys include
+    model_version(), so cells cached before a change to the simulator are run again.
+
+    Returns a dict with the grid axes and one array per metric, shaped
+    (len(spreads), len(sizes), len(sigmas), len(mus)).
+    """
+    seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(n_seeds)]
+    # Plain Python scalars, so grids built with NumPy still make JSON cache keys
+    axes = tuple(np.asarray(axis).tolist() for axis in (spreads, sizes, sigmas, mus))
+    shape = tuple(len(axis) for axis in axes)
+    results = {metric: np.full(shape, np.nan) for metric in METRICS}
+    version = model_version() if cache_dir else None
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as pool:
+        futures = {}
+        for index in itertools.product(*(range(n) for n in shape)):
+            spread, size, sigma, mu = (axis[i] for axis, i in zip(axes, index))
+            params = {"initial_price": initial_price, "mu": mu, "sigma": sigma,
+                      "num_steps": num_steps, "spread": spread, "size": size,
+                      "strategy": strategy, "strategy_params": strategy_params or {}}
+            futures[pool.submit(_run_cell_cached, params, seeds, cache_dir, version)] = index
+        for future in as_completed(futures):
+            cell = future.result()
+            for metric in METRICS:
+                results[metric][futures[future]] = cell[metric]
+
+    return {"spreads": axes[0], "sizes": axes[1], "sigmas": axes[2], "mus": axes[3], **results}
+
+
+def plot_heatmap(data, x_values, y_values, title, xlabel="Order Size", ylabel="Spread", cmap='RdYlGn'):
+    """
+    Plots a grid of sweep results in the style of the heat_map app: mid-grey
+    background, white labels and a colorbar, with one labelled cell per grid point.
+
+    Parameters:
+    -----------
+    data : 2D array
+        Values with rows along y_values and columns along x_values.
+    x_values, y_values : sequences
+        Grid values for the columns and rows.
+    title : str
+        Title of the heatmap.
+    cmap : str
+        Colormap for the heatmap.
+
+    Returns:
+    --------
+    fig : matplotlib Figure
+        The heatmap figure.
+    """
+    fig, ax = plt.subplots(figsize=(8, 6))
+
+    fig.patch.set_facecolor('#4C4C4C')
+    ax.set_facecolor('#4C4C4C')
+
+    c = ax.imshow(data, origin='lower', aspect='auto', cmap=cmap)
+
+    ax.set_xticks(range(len(x_values)), [f"{x:g}" for x in x_values])
+    ax.set_yticks(range(len(y_values)), [f"{y:g}" for y in y_values])
+    for (i, j), value in np.ndenumerate(data):
+        ax.text(j, i, f"{value:.0f}", ha='center', va='center', fontsize=10, color='black')
+
+    ax.set_title(title, fontsize=16, color='white')
+    ax.set_xlabel(xlabel, fontsize=14, color='white')
+    ax.set_ylabel(ylabel, fontsize=14, color='white')
+    ax.tick_params(axis='both', which='major', labelsize=12, colors='white')
+
+    cbar = fig.colorbar(c, ax=ax)
+    cbar.ax.tick_params(labelcolor='white')
+
+    return fig
+
+
+if __name__ == "__main__":
+    import time
+
+    start = time.perf_counter()
+    sweep = run_sweep(spreads=[0.02, 0.05, 0.10, 0.20], sizes=[5, 10, 25, 50], n_seeds=4, num_steps=200)
+    print(f"Sweep finished in {time.perf_counter() - start:.1f}s")
+
+    # spread x size slice at the first sigma / mu
+    fig = plot_heatmap(sweep["mean_pnl"][:, :, 0, 0], sweep["sizes"], sweep["spreads"], "Mean Final PnL")
+    fig.savefig("sweep_pnl.png", facecolor=fig.get_facecolor())
+    fig = plot_heatmap(sweep["mean_drawdown"][:, :, 0, 0], sweep["sizes"], sweep["spreads"],
+                       "Mean Max Drawdown", cmap='RdYlGn_r')
+    fig.savefig("sweep_drawdown.png", facecolor=fig.get_facecolor())
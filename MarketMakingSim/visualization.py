@@ -1,16 +1,37 @@
+import os
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import numpy as np
 import streamlit as st
 
 
+def _padded_limits(values, pad=0.05):
+    """ (low, high) covering values with a small margin, so limits never need rescaling. """
+    low, high = float(np.min(values)), float(np.max(values))
+    margin = (high - low) * pad or abs(high) * pad or 1.0
+    return low - margin, high + margin
+
+
 class MarketMakerVisualizer:
-    def __init__(self, gbm_prices, total_pnl):
-        self.gbm_prices = gbm_prices
+    def __init__(self, gbm_prices, total_pnl, max_frames=200, duration=10.0):
+        """
+        Parameters:
+        - gbm_prices, total_pnl: per-step series to plot
+        - max_frames: cap on rendered frames; long runs are decimated to this many
+        - duration: target animation length in seconds
+        """
+        self.gbm_prices = np.asarray(gbm_prices, dtype=float)
         # self.realized_pnl = realized_pnl
         # self.unrealized_pnl = unrealized_pnl
-        self.total_pnl = total_pnl
-        self.steps = len(gbm_prices)
+        self.total_pnl = np.asarray(total_pnl, dtype=float)
+        self.steps = len(self.gbm_prices)
+        self._x = np.arange(self.steps)
+
+        # Rendering cost is bounded by the frame count, not by the number of steps
+        n_frames = max(1, min(self.steps, max_frames))
+        self.frames = np.unique(np.linspace(0, max(self.steps - 1, 0), n_frames).astype(int))
+        self.interval = 1000.0 * duration / len(self.frames)
 
         # Define figure and axis
         self.fig, self.axs = plt.subplots(2, 1, figsize=(10, 8), gridspec_kw={'hspace': 0.4})
@@ -27,37 +48,104 @@ class MarketMakerVisualizer:
         # self.realized_line, = self.axs[1].plot([], [], 'g', lw=2, label='Realized PnL')
         # self.unrealized_line, = self.axs[1].plot([], [], 'r', lw=2, label='Unrealized PnL')
         self.total_line, = self.axs[1].plot([], [], 'b', lw=2, label='Total PnL')
+        for line in (self.price_line, self.total_line):
+            line.set_animated(True)  # drawn per frame on top of a cached background
         self.axs[1].set_title("Market Maker PnL Over Time", fontsize=14, fontweight='bold')
         self.axs[1].set_xlabel("Time Step", fontsize=12)
         self.axs[1].set_ylabel("PnL", fontsize=12)
         self.axs[1].grid(True, linestyle='--', alpha=0.6)
         self.axs[1].legend(fontsize=10)
 
+        # Axis limits are fixed up front from the full series, so frames only
+        # redraw the two line artists (blitting) instead of rescaling the axes
+        if self.steps:
+            for ax, series in ((self.axs[0], self.gbm_prices), (self.axs[1], self.total_pnl)):
+                ax.set_xlim(0, max(self.steps - 1, 1))
+                ax.set_ylim(*_padded_limits(series))
+
         # Define animation
-        self.ani = animation.FuncAnimation(self.fig, self.update, frames=self.steps, interval=100, repeat=False)
+        self.ani = animation.FuncAnimation(self.fig, self.update, frames=self.frames, init_func=self._init,
+                                           interval=self.interval, blit=True, repeat=False)
+
+    @classmethod
+    def from_history(cls, path, **kwargs):
+        """ Visualizer for a history streamed to disk, memory-mapped with read_history. """
+        from SimulationRecorder import read_history
+
+        history = read_history(path)
+        return cls(history["price"], history["total_pnl"], **kwargs)
+
+    def _init(self):
+        self.price_line.set_data([], [])
+        self.total_line.set_data([], [])
+        return self.price_line, self.total_line
 
     def update(self, i):
-        self.price_line.set_data(range(i + 1), self.gbm_prices[:i + 1])
-        
+        self.price_line.set_data(self._x[:i + 1], self.gbm_prices[:i + 1])
+
         # self.realized_line.set_data(range(i + 1), self.realized_pnl[:i + 1])
         # self.unrealized_line.set_data(range(i + 1), self.unrealized_pnl[:i + 1])
-        self.total_line.set_data(range(i + 1), self.total_pnl[:i + 1])
-
-        # Adjust axis limits dynamically
-        self.axs[0].relim()
-        self.axs[0].autoscale_view()
-        self.axs[1].relim()
-        self.axs[1].autoscale_view()
+        self.total_line.set_data(self._x[:i + 1], self.total_pnl[:i + 1])
 
         return self.price_line, self.total_line
-    
-    def save_animation(self, filename="animation.mp4"):
-        """Save animation to a file"""
-        self.ani.save(filename, writer="ffmpeg")
+
+    def iter_frames(self, frames=None):
+        """
+        Yields each animation frame (self.frames by default) as an RGBA array.
+        The axes, labels and grid are rasterized once; every frame only
+        restores that background and draws the two line artists over it.
+        """
+        original_canvas = self.fig.canvas
+        canvas = FigureCanvasAgg(self.fig)
+        try:
+            self._init()
+            canvas.draw()
+            background = canvas.copy_from_bbox(self.fig.bbox)
+            for i in self.frames if frames is None else frames:
+                canvas.restore_region(background)
+                self.update(i)
+                self.axs[0].draw_artist(self.price_line)
+                self.axs[1].draw_artist(self.total_line)
+                yield np.asarray(canvas.buffer_rgba()).copy()
+        finally:
+            self.fig.set_canvas(original_canvas)
+
+    def save_animation(self, filename="animation.mp4", static_above=None):
+        """
+        Save animation to a file. GIFs are assembled directly from blitted
+        frames with pillow, anything else goes through ffmpeg. If the run has
+        more than static_above steps, a single static PNG of the full run is
+        written instead (next to filename). Returns the path actually written.
+        """
+        if static_above is not None and self.steps > static_above:
+            return self.save_static(os.path.splitext(filename)[0] + ".png")
+        if filename.lower().endswith(".gif"):
+            from PIL import Image
+
+            # The last frame contains every colour, so one palette serves all frames
+            last = next(self.iter_frames(self.frames[-1:]))
+            palette = Image.fromarray(last).convert("RGB").quantize()
+            frames = [Image.fromarray(frame).convert("RGB").quantize(palette=palette, dither=Image.Dither.NONE)
+                      for frame in self.iter_frames()]
+            frames[0].save(filename, save_all=True, append_images=frames[1:],
+                           duration=int(self.interval), loop=0, optimize=False)
+        else:
+            self.ani.save(filename, writer="ffmpeg", fps=1000.0 / self.interval)
+        return filename
 
     def save_animation2(self, filename="animation.gif"):
         """Save animation to a file"""
-        self.ani.save(filename, writer="pillow", fps=100) 
+        self.ani.save(filename, writer="pillow", fps=100)
+
+    def save_static(self, filename="animation.png"):
+        """ Draw the full run in one frame and save it as an image. """
+        self.update(self.steps - 1)
+        for line in (self.price_line, self.total_line):
+            line.set_animated(False)
+        self.fig.savefig(filename)
+        for line in (self.price_line, self.total_line):
+            line.set_animated(True)
+        return filename
 
     def show(self):
         plt.show()